@@ -0,0 +1,213 @@
+import os, math, time, asyncio
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+
+from lru import LRUCache
+from metrics import counter, histogram, register_stats
+
+# Admission control for chat turns, checked in this order:
+#   1. token buckets per session and, when client addresses are known, per
+#      client (429 when empty),
+#   2. global queue depth: shed with 503 once ADMISSION_MAX_QUEUE turns wait,
+#   3. one turn in flight per session, later ones wait in arrival order,
+#   4. at most ADMISSION_MAX_IN_FLIGHT turns in flight overall.
+ADMISSION              = os.getenv("ADMISSION", "1").lower() in ("1", "true", "yes")
+SESSION_RATE           = float(os.getenv("SESSION_RATE", "1"))      # turns per second, refilled
+SESSION_BURST          = float(os.getenv("SESSION_BURST", "5"))
+CLIENT_RATE            = float(os.getenv("CLIENT_RATE", "5"))
+CLIENT_BURST           = float(os.getenv("CLIENT_BURST", "20"))
+SESSION_MAX_QUEUE      = int(os.getenv("SESSION_MAX_QUEUE", "4"))   # turns waiting behind the running one
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_QUEUE    = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_TIMEOUT      = float(os.getenv("ADMISSION_TIMEOUT", "30"))
+ADMISSION_MAX_KEYS     = int(os.getenv("ADMISSION_MAX_KEYS", "100000"))
+# e.g. "x-forwarded-for" behind a trusted proxy; otherwise the peer address is used
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "").lower()
+# Behind a proxy (Render, a load balancer) every peer address is the proxy's,
+# and a per-client bucket would cap the whole service at CLIENT_RATE. So the
+# client bucket is only applied ("auto") once real client addresses are
+# known: ADMISSION_CLIENT_HEADER is set, or uvicorn trusts the proxy's
+# X-Forwarded-For (FORWARDED_ALLOW_IPS / --forwarded-allow-ips). "1" forces
+# it on, e.g. when clients connect directly; "0" turns it off.
+ADMISSION_CLIENT_BUCKET = os.getenv("ADMISSION_CLIENT_BUCKET", "auto").lower()
+CLIENT_BUCKET = (bool(ADMISSION_CLIENT_HEADER or os.getenv("FORWARDED_ALLOW_IPS"))
+                 if ADMISSION_CLIENT_BUCKET == "auto" else ADMISSION_CLIENT_BUCKET in ("1", "true", "yes"))
+
+ADMISSION_SHED = counter("admission_shed_total", "Chat turns rejected by admission control.", ["reason"])
+ADMISSION_WAIT = histogram("admission_wait_seconds", "Time a chat turn waited for admission.")
+
+
+def client_id(request: HTTPConnection) -> str:
+    if ADMISSION_CLIENT_HEADER:
+        value = request.headers.get(ADMISSION_CLIENT_HEADER)
+        if value:
+            return value.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def _reject(status: int, reason: str, detail: str, retry_after: float) -> HTTPException:
+    ADMISSION_SHED.child(reason).inc()
+    return HTTPException(status, detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+async def _acquire(primitive, deadline: float) -> None:
+    # uncontended acquires complete without suspending; skip wait_for's task
+    if primitive.locked():
+        await asyncio.wait_for(primitive.acquire(), max(deadline - time.perf_counter(), 0.001))
+    else:
+        await primitive.acquire()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class Ticket:
+    """An admitted turn. release() is idempotent, so it can be called both
+    when a streamed body ends and from a fallback background task."""
+
+    __slots__ = ("_ctl", "_sid", "_released")
+
+    def __init__(self, ctl: "AdmissionControl", sid: Optional[str]):
+        self._ctl = ctl
+        self._sid = sid
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._ctl._release(self._sid)
+
+    async def guard(self, body):
+        """Wrap a streamed body so the turn is released when it finishes."""
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class _SessionSlot:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()   # FIFO: waiters are woken in arrival order
+        self.users = 0
+
+
+class AdmissionControl:
+    def __init__(self, enabled: bool = ADMISSION, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 max_queue: int = ADMISSION_MAX_QUEUE, session_max_queue: int = SESSION_MAX_QUEUE,
+                 timeout: float = ADMISSION_TIMEOUT, client_bucket: bool = CLIENT_BUCKET):
+        self.enabled = enabled
+        self.client_bucket = client_bucket
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.session_max_queue = session_max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self._session_buckets = LRUCache(max_entries=ADMISSION_MAX_KEYS)
+        self._client_buckets = LRUCache(max_entries=ADMISSION_MAX_KEYS)
+        self._sessions: Dict[str, _SessionSlot] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def _bucket(self, cache: LRUCache, key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = cache.get(key, count=False)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            cache.set(key, bucket, 1)
+        return bucket
+
+    async def admit(self, sid: str, client: str) -> Ticket:
+        """Wait for the turn's slot, or raise 429/503 with Retry-After."""
+        if not self.enabled:
+            return Ticket(self, None)
+        if self.client_bucket:
+            wait = self._bucket(self._client_buckets, client, CLIENT_RATE, CLIENT_BURST).take()
+            if wait:
+                raise _reject(429, "client_rate", "Too many requests from this client", wait)
+        wait = self._bucket(self._session_buckets, sid, SESSION_RATE, SESSION_BURST).take()
+        if wait:
+            raise _reject(429, "session_rate", "Too many requests for this session", wait)
+        slot = self._sessions.get(sid)
+        if slot is None:
+            slot = self._sessions[sid] = _SessionSlot()
+        if slot.users > self.session_max_queue:
+            raise _reject(429, "session_queue", "Too many turns queued for this session", 1)
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+        queue = slot.lock.locked() or self._sem.locked()
+        if queue and self.queued >= self.max_queue:
+            if not slot.users:
+                del self._sessions[sid]
+            raise _reject(503, "queue_full", "Server is busy", 1 + self.queued / max(self.max_in_flight, 1))
+
+        slot.users += 1
+        self.queued += queue
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        locked = False
+        try:
+            await _acquire(slot.lock, deadline)
+            locked = True
+            await _acquire(self._sem, deadline)
+        except asyncio.TimeoutError:
+            self._leave(sid, slot, locked)
+            raise _reject(503, "timeout", "Timed out waiting for capacity", 1)
+        except BaseException:
+            self._leave(sid, slot, locked)
+            raise
+        finally:
+            self.queued -= queue
+        ADMISSION_WAIT.observe(time.perf_counter() - started)
+        self.in_flight += 1
+        self.admitted += 1
+        return Ticket(self, sid)
+
+    def _leave(self, sid: str, slot: _SessionSlot, locked: bool) -> None:
+        if locked:
+            slot.lock.release()
+        slot.users -= 1
+        if slot.users == 0 and self._sessions.get(sid) is slot:
+            del self._sessions[sid]
+
+    def _release(self, sid: Optional[str]) -> None:
+        if sid is None:
+            return
+        self.in_flight -= 1
+        self._sem.release()
+        self._leave(sid, self._sessions[sid], True)
+
+    def stats(self):
+        return {"enabled": self.enabled, "client_bucket": self.client_bucket, "in_flight": self.in_flight, "queued": self.queued,
+                "max_in_flight": self.max_in_flight, "max_queue": self.max_queue,
+                "active_sessions": len(self._sessions), "admitted": self.admitted}
+
+
+ADMISSION_CONTROL = AdmissionControl()
+register_stats("admission", "Chat admission control", ADMISSION_CONTROL.stats)
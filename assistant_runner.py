@@ -1,109 +1,161 @@
-# Here we Assistant API with Threads & Runs: we create a thread, add a user message, run the assistant on that thread, poll to see if GPT needs to call a function if so, call our backend, submit tool outputs back to GPT and show the GPT reply
+# Here we use the Assistants API with Threads & Runs: we create a thread, add a user message, run the assistant on that thread and follow the run's streamed events. When GPT needs to call functions, we call our backend once for all of them (/tools/invoke), submit every tool output back in one call and keep streaming until the GPT reply is complete.
 
-# Full Asistants API Flow works correctly and it handles tool calls correctly. Calling backend and passing output back to GPT works.
-import openai
+# The runner is reusable: AssistantRunner.ask() drives one thread/run, ask_many() drives many of them concurrently from one event loop. If streaming is unavailable it falls back to polling with adaptive backoff instead of a fixed sleep.
+import asyncio
+import json
 import os
-import requests
-from dotenv import load_dotenv
+import sys
 from pathlib import Path
-import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+from dotenv import load_dotenv
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
 
-# Loading env variables (loads my OpenAI API key, used for the openai.beta.threads calls)
+# Loading env variables (loads my OpenAI API key and our Assistant's ID)
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Loads our Assistant’s ID from .env
 ASSISTANT_ID = os.getenv("ASSISTANT_ID")
+BACKEND_URL = os.getenv("BACKEND_URL", "https://qripsy-backend.onrender.com")
 
-# Creating a thread (A thread is a conversation container, one Assistant can run multiple threads.)
-thread = openai.beta.threads.create()
-
-# Adding user message to the thread
-openai.beta.threads.messages.create(
-    thread_id=thread.id,
-    role="user",
-    content="“Can you give me safety information for Spain?”"
-)
-
-# Run the assistant on this thread, at this point the assistant will read the message, decide if it wants to call a function (tool) or reply normally.
-run = openai.beta.threads.runs.create(
-    thread_id=thread.id,
-    assistant_id=ASSISTANT_ID,
-    max_output_tokens=3000 
-)
-
-# Poll for completion
-print(" Waiting for Assistant to respond...")
-while True:
-    run_status = openai.beta.threads.runs.retrieve(thread_id=thread.
-    id, run_id=run.id)
-    # This loop checks every few seconds if the Assistant is done or needs an action.
-    if run_status.status == "completed":
-        break
-    
-    elif run_status.status == "requires_action":
-        tool_call = run_status.required_action.submit_tool_outputs.tool_calls[0]
-        name = tool_call.function.name
-        args = eval(tool_call.function.arguments)
-
-        print(f" Assistant wants to call {name} with {args}")
-
-        # Handle different tool names dynamically:
-        if name == "plan_trip":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/plan_trip",
-                json=args
-            )
-        elif name == "get_esim_options":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/get_esim_options",
-                json=args
-            )
-        elif name == "get_safety_info":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/get_safety_info",
-                json=args
-            )
-        elif name == "get_translation":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/get_translation",
-                json=args
-            )
-        elif name == "get_local_events":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/get_local_events",
-                json=args
-            )
-        elif name == "conversation":
-            response = requests.post(
-                url="https://qripsy-backend.onrender.com/get_local_events",
-                json=args
-            )
-
-
-        else:
-            raise ValueError(f"Unknown tool name: {name}")
-
-        tool_output = response.json()
-
-        openai.beta.threads.runs.submit_tool_outputs(
-            thread_id=thread.id,
-            run_id=run.id,
-            tool_outputs=[
-                {
-                    "tool_call_id": tool_call.id,
-                    "output": str(tool_output)
-                }
-            ]
-        )
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
 
 
-    # Waits 2 seconds and check again if not ready yet
-    else:
-        time.sleep(2)
+class BackendTools:
+    """Tool registry backed by our FastAPI service. All tool calls of one
+    step go out as a single /tools/invoke batch on a pooled HTTP client."""
 
-# Once the run completes, we list messages in the thread, print the final GPT reply.
-messages = openai.beta.threads.messages.list(thread_id=thread.id)
-final_msg = messages.data[0].content[0].text.value
-print("\n Final GPT Reply:\n", final_msg)
+    def __init__(self, base_url: str = BACKEND_URL, http: Optional[httpx.AsyncClient] = None):
+        self.http = http or httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(30, connect=5),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    async def run(self, calls: Sequence[Any]) -> List[Dict[str, str]]:
+        batch = []
+        outputs: Dict[str, str] = {}
+        for call in calls:
+            try:
+                args = json.loads(call.function.arguments or "{}")
+            except json.JSONDecodeError as e:
+                outputs[call.id] = json.dumps({"ok": False, "error": {"type": "invalid_arguments", "detail": str(e)}})
+                continue
+            batch.append((call.id, {"name": call.function.name, "arguments": args}))
+
+        if batch:
+            rsp = await self.http.post("/tools/invoke", json={"calls": [c for _, c in batch]})
+            rsp.raise_for_status()
+            for (call_id, _), result in zip(batch, rsp.json()["results"]):
+                body = result["result"] if result["ok"] else {"ok": False, "error": result["error"]}
+                outputs[call_id] = json.dumps(body)
+
+        return [{"tool_call_id": c.id, "output": outputs[c.id]} for c in calls]
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+class AssistantRunner:
+    def __init__(self, assistant_id: str = ASSISTANT_ID, client: Optional[AsyncOpenAI] = None,
+                 tools: Optional[BackendTools] = None, max_output_tokens: int = 3000,
+                 stream: bool = True, poll_min: float = 0.2, poll_max: float = 2.0):
+        self.assistant_id = assistant_id
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.tools = tools or BackendTools()
+        self.max_output_tokens = max_output_tokens
+        self.stream = stream
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+
+    async def ask(self, content: str) -> str:
+        # A thread is a conversation container, one Assistant can run multiple threads.
+        thread = await self.client.beta.threads.create(messages=[{"role": "user", "content": content}])
+        if self.stream:
+            try:
+                stream = await self.client.beta.threads.runs.create(
+                    thread_id=thread.id,
+                    assistant_id=self.assistant_id,
+                    max_completion_tokens=self.max_output_tokens,
+                    stream=True,
+                )
+            except (APIConnectionError, APIStatusError):
+                # no run was started; fall back to polling
+                pass
+            else:
+                return await self._follow(thread.id, stream)
+        return await self._run_polling(thread.id)
+
+    async def ask_many(self, contents: Sequence[str]) -> List[str]:
+        return list(await asyncio.gather(*(self.ask(c) for c in contents)))
+
+    async def _follow(self, thread_id: str, stream: Any) -> str:
+        parts: List[str] = []
+        while stream is not None:
+            next_stream = None
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.message.delta":
+                        for c in event.data.delta.content or ():
+                            if c.type == "text" and c.text and c.text.value:
+                                parts.append(c.text.value)
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        outputs = await self.tools.run(run.required_action.submit_tool_outputs.tool_calls)
+                        # the run continues on the stream returned by the submission
+                        next_stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                            run_id=run.id, thread_id=thread_id, tool_outputs=outputs, stream=True,
+                        )
+                        break
+                    elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                        raise RuntimeError(f"Run {event.data.id} ended with status {event.data.status}")
+                    elif event.event == "error":
+                        raise RuntimeError(f"Stream error: {event.data.message}")
+            stream = next_stream
+        return "".join(parts)
+
+    async def _run_polling(self, thread_id: str) -> str:
+        run = await self.client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=self.assistant_id,
+            max_completion_tokens=self.max_output_tokens,
+        )
+        delay = self.poll_min
+        status = run.status
+        while run.status not in TERMINAL_STATUSES:
+            if run.status == "requires_action":
+                outputs = await self.tools.run(run.required_action.submit_tool_outputs.tool_calls)
+                run = await self.client.beta.threads.runs.submit_tool_outputs(
+                    run_id=run.id, thread_id=thread_id, tool_outputs=outputs,
+                )
+                delay = self.poll_min
+                continue
+            await asyncio.sleep(delay)
+            run = await self.client.beta.threads.runs.retrieve(run_id=run.id, thread_id=thread_id)
+            # back off while nothing changes, start over quickly when it does
+            delay = self.poll_min if run.status != status else min(delay * 2, self.poll_max)
+            status = run.status
+
+        if run.status != "completed":
+            raise RuntimeError(f"Run {run.id} ended with status {run.status}")
+        messages = await self.client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+        return messages.data[0].content[0].text.value
+
+    async def aclose(self) -> None:
+        await self.tools.aclose()
+        await self.client.close()
+
+
+async def main(prompts: Sequence[str]) -> None:
+    runner = AssistantRunner()
+    try:
+        print(" Waiting for Assistant to respond...")
+        for prompt, reply in zip(prompts, await runner.ask_many(prompts)):
+            print(f"\n {prompt}\n Final GPT Reply:\n", reply)
+    finally:
+        await runner.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:] or ["Can you give me safety information for Spain?"]))
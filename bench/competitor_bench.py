@@ -0,0 +1,63 @@
+"""Micro-benchmark: compiled competitor matcher vs. the original two-pass check.
+
+    python bench/competitor_bench.py [--number N]
+"""
+import argparse, os, random, string, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from competitor import DEFAULT_KEYWORDS, CompetitorMatcher
+
+_PUNCT_TABLE = str.maketrans({c: " " for c in string.punctuation})
+
+def legacy_contains_competitor(text: str) -> bool:
+    # main.contains_competitor before the compiled matcher
+    norm = text.casefold().translate(_PUNCT_TABLE)
+    tokens = {t for t in norm.split() if t}
+    if any(" " in kw and kw in norm for kw in DEFAULT_KEYWORDS):
+        return True
+    return any(kw in tokens for kw in DEFAULT_KEYWORDS if " " not in kw)
+
+WORDS = ("trip travel japan tokyo data plan roaming esim phone hotel museum "
+         "train station dinner beach weekend budget coverage unlimited").split()
+
+def corpus(n_words: int, hit: bool, rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    if hit:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(["Airalo", "maya mobile", "Nomad,"]))
+    return " ".join(words)
+
+def best(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=2000)
+    args = ap.parse_args()
+
+    rng = random.Random(7)
+    matcher = CompetitorMatcher(DEFAULT_KEYWORDS, path=None)
+    cases = [(f"{n}w {'hit' if hit else 'miss'}", corpus(n, hit, rng))
+             for n in (10, 100, 400) for hit in (False, True)]
+
+    print(f"{'case':<12}{'legacy us':>12}{'compiled us':>14}{'speedup':>10}")
+    for name, text in cases:
+        assert legacy_contains_competitor(text) == matcher.contains(text), name
+        old = best(lambda: legacy_contains_competitor(text), args.number)
+        new = best(lambda: matcher.contains(text), args.number)
+        print(f"{name:<12}{old * 1e6:>12.2f}{new * 1e6:>14.2f}{old / new:>9.1f}x")
+
+    # streamed: 8-char chunks through the incremental scanner
+    text = cases[-2][1]
+    chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+    def scan():
+        s = matcher.scanner()
+        for c in chunks:
+            if s.feed(c):
+                return True
+        return s.finish()
+    t = best(scan, args.number // 4)
+    print(f"stream scan of {len(text)} chars in {len(chunks)} chunks: {t * 1e6:.2f} us")
+
+if __name__ == "__main__":
+    main()
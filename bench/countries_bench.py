@@ -0,0 +1,58 @@
+"""Micro-benchmark: country index load time and lookups, against the
+original hardcoded infer_region.
+
+    python bench/countries_bench.py [--number N]
+"""
+import argparse, os, sys, time, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from countries import COUNTRIES_PATH, CountryIndex
+
+def legacy_infer_region(country: str) -> str:
+    # main.infer_region before the country index
+    c = country.casefold()
+    if c in {"usa","united states","united states of america","canada","mexico"}:
+        return "North America"
+    if c in {"france","germany","italy","spain","uk","united kingdom","england","scotland"}:
+        return "Europe"
+    return "Global"
+
+CASES = [
+    ("name", "Spain"),
+    ("alias", "The U.S.A."),
+    ("native", "Deutschland"),
+    ("iso3", "JPN"),
+    ("typo", "Thiland"),
+    ("transposed", "Itlay"),
+    ("miss", "Atlantis"),
+]
+
+def best(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=20000)
+    args = ap.parse_args()
+
+    loads = []
+    for _ in range(5):
+        start = time.perf_counter()
+        index = CountryIndex.load(COUNTRIES_PATH)
+        loads.append(time.perf_counter() - start)
+    print(f"load+compile: {min(loads) * 1e3:.2f} ms  {index.stats()['countries']} countries, "
+          f"{index.stats()['names']} names, {index.stats()['trigrams']} trigrams")
+
+    print(f"{'case':<12} {'query':<14} {'match':<16} {'legacy':>9} {'uncached':>10} {'memoized':>10}")
+    for case, query in CASES:
+        found = index.lookup(query)
+        t_legacy = best(lambda: legacy_infer_region(query), args.number)
+        t_cold = best(lambda: index.exact(query) or index.fuzzy(query), max(args.number // 10, 1))
+        t_memo = best(lambda: index.lookup(query), args.number)
+        print(f"{case:<12} {query:<14} {found.name if found else '-':<16} {t_legacy * 1e9:>7.0f}ns "
+              f"{t_cold * 1e9:>8.0f}ns {t_memo * 1e9:>8.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Local stand-in for the OpenAI API, used by the load tests.
+
+Serves /v1/responses and /v1/chat/completions (streaming and not) from
+bench/recordings.json with configurable latency and streaming speed;
+translation and day-plan requests are answered with tagged copies of
+their input:
+
+    FAKE_LATENCY_MS      time before the first token (default 300)
+    FAKE_TOKENS_PER_SEC  streaming speed, one word ~ one token (default 80)
+    FAKE_JITTER          +/- fraction applied to both (default 0.2)
+    FAKE_MODEL_SPEEDUP   per-model factor applied to both, e.g. "gpt-4o-mini=3"
+
+    uvicorn --app-dir bench fake_openai:app --port 8100
+"""
+import asyncio, json, os, random, time, uuid
+from pathlib import Path
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY    = float(os.getenv("FAKE_LATENCY_MS", "300")) / 1000
+TOKENS_SEC = float(os.getenv("FAKE_TOKENS_PER_SEC", "80"))
+JITTER     = float(os.getenv("FAKE_JITTER", "0.2"))
+SPEEDUP    = {m: float(f) for m, _, f in (kv.partition("=") for kv in os.getenv("FAKE_MODEL_SPEEDUP", "").split(",") if kv)}
+
+RECORDINGS = json.loads((Path(__file__).parent / "recordings.json").read_text())
+
+app = FastAPI(title="fake-openai")
+
+
+def _jitter(x: float) -> float:
+    return max(0.0, x * random.uniform(1 - JITTER, 1 + JITTER))
+
+def _last_user_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    for m in reversed(messages or []):
+        if m.get("role") == "user":
+            c = m.get("content")
+            return c if isinstance(c, str) else json.dumps(c)
+    return ""
+
+def _pick(entries: List[Dict[str, Any]], text: str) -> Dict[str, Any]:
+    text = text.casefold()
+    return next(e for e in entries if e["match"] in text)
+
+def _reply_text(body: Dict[str, Any]) -> str:
+    prompt = body.get("input")
+    if (body.get("instructions") or "").startswith("Translate"):
+        items = json.loads(prompt)["items"]
+        return json.dumps({"translations": [f"[{i['target_language']}] {i['text']}" for i in items]})
+    if (body.get("instructions") or "").startswith("You plan one day"):
+        p = json.loads(prompt)
+        return json.dumps({slot: f"Day {p['day']} {slot} in {p['destination']}." for slot in ("morning", "afternoon", "evening")})
+    if isinstance(prompt, str) and prompt.startswith("Summarize"):
+        return RECORDINGS["summary"]
+    return _pick(RECORDINGS["responses"], _last_user_text(prompt or body.get("messages")))["text"]
+
+def _words(text: str) -> List[str]:
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + words[-1:]
+
+def _usage(text: str) -> Dict[str, Any]:
+    out = len(_words(text))
+    return {"input_tokens": 50, "output_tokens": out, "total_tokens": 50 + out,
+            "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# --- Responses API ---
+def _response(model: str, text: str, status: str = "completed") -> Dict[str, Any]:
+    return {
+        "id": f"resp_{uuid.uuid4().hex[:16]}", "object": "response", "created_at": int(time.time()),
+        "model": model, "status": status, "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "output": [{"type": "message", "id": "msg_0", "role": "assistant", "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}] if text else [],
+        "usage": _usage(text) if status == "completed" else None,
+    }
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o")
+    text = _reply_text(body)
+    if body.get("max_output_tokens"):
+        text = "".join(_words(text)[:body["max_output_tokens"]])
+    speed = SPEEDUP.get(model, 1.0)
+    latency, tokens_sec = LATENCY / speed, TOKENS_SEC * speed
+    if not body.get("stream"):
+        await asyncio.sleep(_jitter(latency) + len(_words(text)) / tokens_sec)
+        return JSONResponse(_response(model, text))
+
+    async def events():
+        seq = 0
+        yield _sse("response.created", {"type": "response.created", "sequence_number": seq,
+                                        "response": _response(model, "", "in_progress")})
+        await asyncio.sleep(_jitter(latency))
+        for w in _words(text):
+            seq += 1
+            yield _sse("response.output_text.delta", {
+                "type": "response.output_text.delta", "sequence_number": seq, "item_id": "msg_0",
+                "output_index": 0, "content_index": 0, "delta": w})
+            await asyncio.sleep(_jitter(1 / tokens_sec))
+        yield _sse("response.completed", {"type": "response.completed", "sequence_number": seq + 1,
+                                          "response": _response(model, text)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# --- Chat Completions API ---
+def _chunk(cid: str, model: str, delta: Dict[str, Any], finish: Any = None) -> str:
+    data = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+    return f"data: {json.dumps(data)}\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o")
+    messages = body.get("messages", [])
+    cid = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    calls = []
+    if body.get("tools") and not any(m.get("role") == "tool" for m in messages):
+        calls = [{"id": f"call_{i}", "type": "function",
+                  "function": {"name": c["name"], "arguments": json.dumps(c["arguments"])}}
+                 for i, c in enumerate(_pick(RECORDINGS["tool_calls"], _last_user_text(messages))["calls"])]
+    text = "" if calls else _reply_text(body)
+
+    if not body.get("stream"):
+        await asyncio.sleep(_jitter(LATENCY) + len(_words(text)) / TOKENS_SEC)
+        message: Dict[str, Any] = {"role": "assistant", "content": text or None}
+        if calls:
+            message["tool_calls"] = calls
+        return JSONResponse({
+            "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if calls else "stop"}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": len(_words(text)), "total_tokens": 50 + len(_words(text))},
+        })
+
+    async def chunks():
+        await asyncio.sleep(_jitter(LATENCY))
+        if calls:
+            for i, c in enumerate(calls):
+                yield _chunk(cid, model, {"role": "assistant", "tool_calls": [{"index": i, **c}]})
+            yield _chunk(cid, model, {}, "tool_calls")
+        else:
+            for w in _words(text):
+                yield _chunk(cid, model, {"role": "assistant", "content": w})
+                await asyncio.sleep(_jitter(1 / TOKENS_SEC))
+            yield _chunk(cid, model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": m, "object": "model", "created": 0, "owned_by": "bench"}
+                                       for m in ("gpt-4o", "gpt-4o-mini")]}
@@ -0,0 +1,260 @@
+"""Load test for every route, against a local fake OpenAI.
+
+Starts bench/fake_openai.py and the app (main:app) under uvicorn, drives
+each scenario at the given concurrency levels and writes a JSON report
+with p50/p95/p99 latency, throughput, time-to-first-byte for streaming
+routes and peak server RSS.
+
+    python bench/loadtest.py --concurrency 1,8,32 --requests 200
+    python bench/loadtest.py --out bench/results/new.json --compare bench/results/base.json
+
+With --compare, p95 latency or throughput more than --tolerance worse than
+the baseline is reported and the exit status is 1.
+"""
+import argparse, asyncio, itertools, json, os, platform, statistics, subprocess, sys, time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH = Path(__file__).resolve().parent
+
+_ids = itertools.count()
+
+class Scenario(NamedTuple):
+    name: str
+    path: str
+    body: Callable[[], Optional[Dict[str, Any]]]
+    stream: bool = False
+
+def _session() -> str:
+    return f"bench-{next(_ids)}"
+
+SCENARIOS: List[Scenario] = [
+    Scenario("health", "/health", lambda: None),
+    Scenario("plan_trip", "/plan_trip", lambda: {"destination": "Rome", "days": 7, "interests": ["history", "food"]}),
+    Scenario("plan_trip_30d", "/plan_trip", lambda: {"destination": "Japan", "days": 30, "interests": ["food", "temples", "nightlife"]}),
+    Scenario("plan_trip_stream", "/plan_trip/stream", lambda: {"destination": f"Bench City {next(_ids)}", "days": 7, "interests": ["food"]}, stream=True),
+    Scenario("get_esim_options", "/get_esim_options", lambda: {"country": "Spain", "device": "iPhone 15"}),
+    Scenario("get_safety_info", "/get_safety_info", lambda: {"country": "Spain"}),
+    Scenario("get_translation", "/get_translation", lambda: {"phrase": "where is the station", "target_language": "Spanish"}),
+    Scenario("get_translation_miss", "/get_translation", lambda: {"phrase": f"bench phrase {next(_ids)}", "target_language": "Spanish"}),
+    Scenario("get_translations", "/get_translations", lambda: {"phrases": ["thank you", "where is the bathroom", f"bench phrase {next(_ids)}"], "target_language": "French"}),
+    Scenario("get_local_events", "/get_local_events", lambda: {"city": "Lisbon"}),
+    Scenario("conversation", "/conversation", lambda: {"message": "Which eSIM should I buy for my trip to Japan?"}),
+    Scenario("tools_invoke", "/tools/invoke", lambda: {"calls": [
+        {"name": "get_safety_info", "arguments": {"country": "Spain"}},
+        {"name": "get_local_events", "arguments": {"city": "Madrid"}},
+        {"name": "plan_trip", "arguments": {"destination": "Madrid", "days": 3}},
+    ]}),
+    Scenario("chat", "/chat", lambda: {"session_id": _session(), "message": "eSIM for Japan?"}),
+    Scenario("chat_stream", "/chat_stream", lambda: {"session_id": _session(), "message": "Is Spain safe?"}, stream=True),
+    Scenario("agent", "/agent", lambda: {"session_id": _session(), "message": "Safety info and events for Spain?"}, stream=True),
+]
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _spawn(app: str, app_dir: Path, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--app-dir", str(app_dir), app,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env}, cwd=str(ROOT),
+    )
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited early ({proc.returncode}) while waiting for {url}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+def _rss_kb(pid: int, field: str) -> Optional[int]:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50_ms": _ms(_pct(values, 50)), "p95_ms": _ms(_pct(values, 95)), "p99_ms": _ms(_pct(values, 99)),
+        "mean_ms": _ms(statistics.fmean(values)) if values else None,
+    }
+
+def _ms(v: Optional[float]) -> Optional[float]:
+    return round(v * 1000, 3) if v is not None else None
+
+
+async def _one(client: httpx.AsyncClient, sc: Scenario, lat: List[float], ttfb: List[float], errors: List[str]) -> None:
+    body = sc.body()
+    start = time.perf_counter()
+    try:
+        if body is None:
+            rsp = await client.get(sc.path)
+            ok = rsp.status_code < 400
+        else:
+            async with client.stream("POST", sc.path, json=body) as rsp:
+                first = True
+                async for _ in rsp.aiter_raw():
+                    if first:
+                        ttfb.append(time.perf_counter() - start)
+                        first = False
+                ok = rsp.status_code < 400
+        if not ok:
+            errors.append(str(rsp.status_code))
+            return
+        lat.append(time.perf_counter() - start)
+    except httpx.HTTPError as e:
+        errors.append(type(e).__name__)
+
+async def run_scenario(base_url: str, sc: Scenario, concurrency: int, total: int, pid: int) -> Dict[str, Any]:
+    lat: List[float] = []
+    ttfb: List[float] = []
+    errors: List[str] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await _one(client, sc, [], [], [])  # warm the connection and caches
+        queue = iter(range(total))
+        peak = 0
+
+        async def worker():
+            for _ in queue:
+                await _one(client, sc, lat, ttfb, errors)
+
+        async def sample_rss():
+            nonlocal peak
+            while True:
+                peak = max(peak, _rss_kb(pid, "VmRSS") or 0)
+                await asyncio.sleep(0.05)
+
+        sampler = asyncio.ensure_future(sample_rss())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+
+    result = {
+        "scenario": sc.name, "path": sc.path, "concurrency": concurrency,
+        "requests": total, "ok": len(lat), "errors": len(errors),
+        "error_kinds": sorted(set(errors)),
+        "throughput_rps": round(len(lat) / elapsed, 2) if elapsed else None,
+        **_summary(lat),
+        "peak_rss_kb": peak or None,
+    }
+    if sc.stream:
+        result["ttfb"] = _summary(ttfb)
+    return result
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    base = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get((r["scenario"], r["concurrency"]))
+        if not b:
+            continue
+        key = f"{r['scenario']}@{r['concurrency']}"
+        if b.get("p95_ms") and r.get("p95_ms") and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {b['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if b.get("throughput_rps") and r.get("throughput_rps") and r["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {b['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} rps")
+    return regressions
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    ap.add_argument("--scenarios", default="", help="comma-separated subset of scenario names")
+    ap.add_argument("--latency-ms", default="300", help="fake upstream latency before the first token")
+    ap.add_argument("--tokens-per-sec", default="80", help="fake upstream streaming speed")
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app server")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--compare", default="")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    args = ap.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    wanted = set(filter(None, args.scenarios.split(",")))
+    scenarios = [s for s in SCENARIOS if not wanted or s.name in wanted]
+
+    fake_port, app_port = _free_port(), _free_port()
+    fake = _spawn("fake_openai:app", BENCH, fake_port, {
+        "FAKE_LATENCY_MS": args.latency_ms, "FAKE_TOKENS_PER_SEC": args.tokens_per_sec,
+    })
+    app_env = {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1", "OPENAI_API_KEY": "bench",
+        # every simulated user comes from 127.0.0.1; pass --env ADMISSION_CLIENT_BUCKET=1
+        # --env CLIENT_RATE=... to test per-client throttling
+        "CLIENT_RATE": "1000000", "CLIENT_BURST": "1000000",
+        **dict(kv.split("=", 1) for kv in args.env),
+    }
+    app = None
+    try:
+        _wait_ready(f"http://127.0.0.1:{fake_port}/v1/models", fake)
+        app = _spawn("main:app", ROOT, app_port, app_env)
+        startup = _wait_ready(f"http://127.0.0.1:{app_port}/health", app)
+        base_url = f"http://127.0.0.1:{app_port}"
+
+        results = []
+        for sc in scenarios:
+            for c in levels:
+                r = asyncio.run(run_scenario(base_url, sc, c, args.requests, app.pid))
+                results.append(r)
+                ttfb = f" ttfb p50 {r['ttfb']['p50_ms']}ms" if "ttfb" in r else ""
+                print(f"{sc.name:<18} c={c:<3} p50 {r['p50_ms']}ms p95 {r['p95_ms']}ms p99 {r['p99_ms']}ms "
+                      f"{r['throughput_rps']} rps err {r['errors']}{ttfb}")
+        peak_rss = _rss_kb(app.pid, "VmHWM")
+    finally:
+        for p in (app, fake):
+            if p is not None:
+                p.terminate()
+                p.wait(10)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {"concurrency": levels, "requests": args.requests, "latency_ms": args.latency_ms,
+                   "tokens_per_sec": args.tokens_per_sec, "env": args.env},
+        "startup_s": round(startup, 3),
+        "peak_rss_kb": peak_rss,
+        "results": results,
+    }
+    out = Path(args.out or BENCH / "results" / f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"wrote {out}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for r in regressions:
+            print("REGRESSION", r)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
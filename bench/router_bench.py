@@ -0,0 +1,114 @@
+"""Model router benchmark: sends a labelled set of chat turns through /chat
+with the router off and on, against a local fake OpenAI where gpt-4o-mini
+answers faster (FAKE_MODEL_SPEEDUP). Reports latency per routed tier, the
+speed-up over the router being off and how often the router picked the
+tier the message is labelled with, so ROUTER_* thresholds can be tuned:
+
+    python bench/router_bench.py
+    python bench/router_bench.py --env ROUTER_LIGHT_WORDS=40 --out bench/results/router.json
+"""
+import argparse, asyncio, json, sys, time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import BENCH, ROOT, _free_port, _ms, _pct, _spawn, _wait_ready
+
+# (message, expected tier)
+CORPUS: List[Tuple[str, str]] = [
+    ("thanks!", "brief"), ("ok", "brief"), ("thank you so much", "brief"), ("hi", "brief"),
+    ("great, bye", "brief"), ("perfect", "brief"), ("got it", "brief"), ("cheers!", "brief"),
+    ("Which eSIM works in Japan?", "light"), ("Is tap water safe in Spain?", "light"),
+    ("Does the eSIM support hotspot?", "light"), ("What is the emergency number in Italy?", "light"),
+    ("Can I top up my data later?", "light"), ("How much data does the unlimited plan include per day?", "light"),
+    ("Do I need to activate the eSIM before landing in Lisbon?", "light"),
+    ("Plan a 5 day itinerary for Rome with food and history", "full"),
+    ("Compare the Data Plan and the Unlimited Plan for a two week trip to Thailand", "full"),
+    ("Explain why my eSIM shows no service after landing and what I should check step by step", "full"),
+    ("What events are on in Madrid this weekend and how do I get there from the airport?", "full"),
+    ("I'm travelling through France, Germany and Italy next month with my family of four; which plan "
+     "should we buy, how should we share the data, and what happens if one of us runs out halfway?", "full"),
+]
+
+async def run(base: str, rounds: int, concurrency: int) -> List[Dict[str, Any]]:
+    sem = asyncio.Semaphore(concurrency)
+    results: List[Dict[str, Any]] = []
+
+    async def one(client: httpx.AsyncClient, i: int, message: str, label: str) -> None:
+        async with sem:
+            start = time.perf_counter()
+            rsp = await client.post(f"{base}/chat", json={"session_id": f"router-{i}", "message": message})
+            results.append({"label": label, "tier": rsp.headers.get("x-model-tier"), "status": rsp.status_code,
+                            "seconds": time.perf_counter() - start})
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        await asyncio.gather(*(one(client, r * len(CORPUS) + i, m, label)
+                               for r in range(rounds) for i, (m, label) in enumerate(CORPUS)))
+    return results
+
+def summarize(results: List[Dict[str, Any]], key: str) -> Dict[str, Any]:
+    groups: Dict[str, List[float]] = {}
+    for r in results:
+        groups.setdefault(r[key], []).append(r["seconds"])
+    return {g: {"n": len(v), "p50_ms": _ms(_pct(v, 50)), "p95_ms": _ms(_pct(v, 95))} for g, v in sorted(groups.items())}
+
+def bench(fake_port: int, env: Dict[str, str], rounds: int, concurrency: int) -> Tuple[List[Dict[str, Any]], Any]:
+    port = _free_port()
+    app = _spawn("main:app", ROOT, port, {"OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1", "OPENAI_API_KEY": "bench",
+                                          "CLIENT_RATE": "1000000", "CLIENT_BURST": "1000000", **env})
+    try:
+        _wait_ready(f"http://127.0.0.1:{port}/health", app)
+        results = asyncio.run(run(f"http://127.0.0.1:{port}", rounds, concurrency))
+        decisions = httpx.get(f"http://127.0.0.1:{port}/router/decisions", params={"limit": 10000}).json()
+        return results, decisions
+    finally:
+        app.terminate()
+        app.wait(10)
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency-ms", default="300")
+    ap.add_argument("--speedup", default="gpt-4o-mini=3", help="FAKE_MODEL_SPEEDUP for the fake upstream")
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the routed app server")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    fake_port = _free_port()
+    fake = _spawn("fake_openai:app", BENCH, fake_port, {"FAKE_LATENCY_MS": args.latency_ms, "FAKE_MODEL_SPEEDUP": args.speedup})
+    try:
+        _wait_ready(f"http://127.0.0.1:{fake_port}/v1/models", fake)
+        baseline, _ = bench(fake_port, {"MODEL_ROUTER": "0"}, args.rounds, args.concurrency)
+        routed, decisions = bench(fake_port, {"MODEL_ROUTER": "1", **dict(kv.split("=", 1) for kv in args.env)},
+                                  args.rounds, args.concurrency)
+    finally:
+        fake.terminate()
+        fake.wait(10)
+
+    agree = sum(r["tier"] == r["label"] for r in routed)
+    report = {
+        "env": args.env,
+        "router_off_ms": {"p50": _ms(_pct([r["seconds"] for r in baseline], 50)),
+                          "p95": _ms(_pct([r["seconds"] for r in baseline], 95))},
+        "router_on_ms": {"p50": _ms(_pct([r["seconds"] for r in routed], 50)),
+                         "p95": _ms(_pct([r["seconds"] for r in routed], 95))},
+        "by_label_off": summarize(baseline, "label"),
+        "by_tier_on": summarize(routed, "tier"),
+        "agreement": round(agree / len(routed), 3),
+        "confusion": {f"{l}->{t}": n for (l, t), n in sorted(Counter((r["label"], r["tier"]) for r in routed).items())},
+        "errors": sum(r["status"] != 200 for r in baseline + routed),
+        "decisions": decisions["decisions"],
+    }
+    print(json.dumps({k: v for k, v in report.items() if k != "decisions"}, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Micro-benchmark: response serialization cost per endpoint.
+
+    before     builder output as response models, then FastAPI's response_model
+               pass (re-validate + jsonable_encoder) and JSONResponse
+    validated  serialization.render(): one validation pass, pydantic's encoder
+    fast       serialization.render() with FAST_RESPONSES (orjson, no validation)
+
+Also reports gzip/br sizes and compression time for each body.
+
+    python bench/serialization_bench.py [--number N]
+"""
+import argparse, asyncio, inspect, os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import compression, serialization
+import main as api
+
+CASES = [
+    ("plan_trip 3d", "/plan_trip", api.TripRequest(destination="Rome", days=3, interests=["history"])),
+    ("plan_trip 30d", "/plan_trip", api.TripRequest(destination="Japan", days=30, interests=["food", "temples", "nightlife"])),
+    ("get_esim_options", "/get_esim_options", api.ESIMRequest(country="Spain", device="iPhone 15")),
+    ("get_safety_info", "/get_safety_info", api.SafetyRequest(country="Spain")),
+    ("get_translation", "/get_translation", api.TranslationRequest(phrase="where is the station", target_language="Spanish")),
+    ("get_local_events", "/get_local_events", api.LocalEventsRequest(city="Lisbon")),
+    ("conversation", "/conversation", api.ConversationRequest(message="Which eSIM should I buy for Japan?")),
+]
+
+def best(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+def _field(path: str):
+    return next(r for r in api.app.routes if getattr(r, "path", None) == path).response_field
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=2000)
+    args = ap.parse_args()
+    loop = asyncio.new_event_loop()
+
+    print(f"{'endpoint':<18} {'before':>9} {'validated':>10} {'fast':>9} {'speedup':>8} "
+          f"{'bytes':>6} {'gzip':>6} {'br':>6} {'gzip us':>8} {'br us':>7}")
+    for name, path, req in CASES:
+        tool = api.TOOLS[path.strip("/")]
+        field = _field(path)
+
+        def build():
+            data = tool.build(req)
+            return loop.run_until_complete(data) if inspect.isawaitable(data) else data
+
+        def before():
+            model = tool.response.model_validate(build())
+            content = loop.run_until_complete(serialize_response(field=field, response_content=model))
+            return JSONResponse(content).body
+
+        def validated():
+            return serialization.render(tool.response, build())
+
+        def fast():
+            return serialization.dumps(build())
+
+        t_before, t_val, t_fast = (best(f, args.number) for f in (before, validated, fast))
+        body = validated()
+        sizes, times = [], []
+        for enc in ("gzip", "br"):
+            if enc == "br" and compression.brotli is None:
+                sizes.append("-"); times.append("-")
+                continue
+            sizes.append(str(len(compression.compress(body, enc))))
+            times.append(f"{best(lambda: compression.compress(body, enc), max(args.number // 10, 1)) * 1e6:.1f}")
+        print(f"{name:<18} {t_before * 1e6:>7.1f}us {t_val * 1e6:>8.1f}us {t_fast * 1e6:>7.1f}us "
+              f"{t_before / t_fast:>7.1f}x {len(body):>6} {sizes[0]:>6} {sizes[1]:>6} {times[0]:>8} {times[1]:>7}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
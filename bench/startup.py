@@ -0,0 +1,77 @@
+"""Cold-start benchmark: import time of main, time until /health is ready and
+time to the first successful tool and chat requests, against a local fake
+OpenAI (see bench/fake_openai.py).
+
+    python bench/startup.py --runs 5
+    python bench/startup.py --runs 5 --env WARMUP=1
+"""
+import argparse, json, os, statistics, subprocess, sys, time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import BENCH, ROOT, _free_port, _spawn, _wait_ready
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+def import_time(env) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=str(ROOT), env={**os.environ, **env},
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def first_request(url: str, body) -> float:
+    start = time.perf_counter()
+    rsp = httpx.post(url, json=body, timeout=60)
+    rsp.raise_for_status()
+    return time.perf_counter() - start
+
+def cold_start(fake_url: str, env) -> dict:
+    port = _free_port()
+    start = time.perf_counter()
+    app = _spawn("main:app", ROOT, port, env)
+    try:
+        ready = _wait_ready(f"http://127.0.0.1:{port}/health", app, timeout=60)
+        base = f"http://127.0.0.1:{port}"
+        tool = first_request(f"{base}/get_safety_info", {"country": "Spain"})
+        chat = first_request(f"{base}/chat", {"session_id": "cold", "message": "eSIM for Japan?"})
+        chat2 = first_request(f"{base}/chat", {"session_id": "warm", "message": "eSIM for Japan?"})
+        return {"ready_s": ready, "first_tool_s": tool, "first_chat_s": chat, "second_chat_s": chat2,
+                "ready_to_first_chat_s": time.perf_counter() - start}
+    finally:
+        app.terminate()
+        app.wait(10)
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--latency-ms", default="50", help="fake upstream latency before the first token")
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app server")
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    fake_port = _free_port()
+    fake = _spawn("fake_openai:app", BENCH, fake_port, {"FAKE_LATENCY_MS": args.latency_ms, "FAKE_JITTER": "0"})
+    env = {"OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1", "OPENAI_API_KEY": "bench",
+           **dict(kv.split("=", 1) for kv in args.env)}
+    try:
+        _wait_ready(f"http://127.0.0.1:{fake_port}/v1/models", fake)
+        imports = [import_time(env) for _ in range(args.runs)]
+        runs = [cold_start(f"http://127.0.0.1:{fake_port}", env) for _ in range(args.runs)]
+    finally:
+        fake.terminate()
+        fake.wait(10)
+
+    report = {"env": args.env, "runs": args.runs, "import_s": round(statistics.median(imports), 4)}
+    for k in runs[0]:
+        report[k] = round(statistics.median(r[k] for r in runs), 4)
+    for k, v in report.items():
+        print(f"{k:<22} {v}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
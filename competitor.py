@@ -0,0 +1,166 @@
+import os, re, string, time, threading
+from typing import Dict, Iterable, Optional, Pattern
+
+from metrics import COMPETITOR_CHECK
+
+DEFAULT_KEYWORDS = {
+    "airalo","airhub","betterroaming","bnesim","bytesim","dent","digital republic",
+    "easysim","escapesim","esim.sm","esim2fly","esim4travel","esimatic","esim-man",
+    "esimple","esimplus","esimx","etravelsim","ezsim","flexiroam","gigago","gigsky",
+    "global yo","globalesim","gomoworld","ifree mogo","instabridge esim","jetpac",
+    "keepgo","knowroaming","kolet","manet travel","maya mobile","microesim","mobimatter",
+    "monty esim","mtx connect","nomad","northsim","rapidesim","redteago","roamify",
+    "saily","simoptions","soracom mobile","stork mobile","taro mobile","textr esim",
+    "travelkon","trifa","truphone","ubigi","upesim","webbing","wifi map","yesim",
+    "yoho mobile","roamless","honest"
+}
+
+# Optional newline-separated keyword file, re-read when its mtime changes.
+KEYWORDS_FILE   = os.getenv("COMPETITOR_KEYWORDS_FILE")
+RELOAD_INTERVAL = float(os.getenv("COMPETITOR_RELOAD_INTERVAL", "5"))
+
+# punctuation and every whitespace character become a plain space, so token
+# boundaries in the normalized text are always " "
+_NORM_TABLE = str.maketrans({
+    **{c: " " for c in string.punctuation},
+    **{chr(i): " " for i in range(0x3001) if chr(i).isspace()},
+})
+_SPACES = re.compile(" {2,}")
+
+def normalize(text: str) -> str:
+    return text.casefold().translate(_NORM_TABLE)
+
+def _normalize_keyword(kw: str) -> str:
+    return " ".join(normalize(kw).split())
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    trie: Dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict) -> str:
+        alts = [(" +" if ch == " " else re.escape(ch)) + emit(child)
+                for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+def compile_keywords(keywords: Iterable[str]) -> Optional[Pattern]:
+    # Keywords go through the same normalization as the text, so a keyword
+    # like "esim.sm" matches the token pair "esim sm". Every keyword must sit
+    # on token boundaries at both ends; the text is searched as " text " and
+    # the leading literal space lets the regex engine skip straight to token
+    # starts.
+    words = {w for w in map(_normalize_keyword, keywords) if w}
+    if not words:
+        return None
+    return re.compile(" (?:" + _trie_pattern(words) + ")(?= )")
+
+
+class CompetitorMatcher:
+    """All keywords compiled into one trie-shaped regex; a check is a single
+    pass over the normalized text."""
+
+    def __init__(self, keywords: Iterable[str] = DEFAULT_KEYWORDS, path: Optional[str] = KEYWORDS_FILE):
+        self.path = path
+        self._mtime = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload(keywords)
+        if path:
+            self.reload_from_file()
+
+    def reload(self, keywords: Iterable[str]) -> None:
+        keywords = frozenset(keywords)
+        pattern = compile_keywords(keywords)
+        longest = max((len(_normalize_keyword(k)) for k in keywords), default=0)
+        # swap as one tuple so readers never see a half-updated matcher
+        self._state = (keywords, pattern, longest)
+
+    def reload_from_file(self) -> bool:
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                return False
+            if mtime == self._mtime:
+                return False
+            with open(self.path, encoding="utf-8") as f:
+                words = [ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+            self.reload(words)
+            self._mtime = mtime
+            return True
+
+    def maybe_reload(self) -> None:
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self._checked >= RELOAD_INTERVAL:
+            self._checked = now
+            self.reload_from_file()
+
+    @property
+    def keywords(self) -> frozenset:
+        return self._state[0]
+
+    def search(self, text: str) -> Optional[str]:
+        self.maybe_reload()
+        pattern = self._state[1]
+        if pattern is None:
+            return None
+        m = pattern.search(f" {normalize(text)} ")
+        return " ".join(m.group().split()) if m else None
+
+    def contains(self, text: str) -> bool:
+        return self.search(text) is not None
+
+    def scanner(self) -> "CompetitorScanner":
+        self.maybe_reload()
+        return CompetitorScanner(self._state[1], self._state[2])
+
+
+class CompetitorScanner:
+    """Incremental matcher for streamed text.
+
+    Keeps only the last `longest + 1` normalized characters between chunks,
+    so keywords split across chunk boundaries are still found. A keyword at
+    the very end of the buffered text is confirmed once the next chunk (or
+    finish()) supplies the token boundary after it.
+    """
+
+    def __init__(self, pattern: Optional[Pattern], longest: int):
+        self._pattern = pattern
+        self._keep = longest + 1
+        self._tail = " "
+        self.match: Optional[str] = None
+
+    def feed(self, chunk: str) -> bool:
+        if self.match is not None or self._pattern is None:
+            return self.match is not None
+        buf = _SPACES.sub(" ", self._tail + normalize(chunk))
+        m = self._pattern.search(buf)
+        if m:
+            self.match = " ".join(m.group().split())
+            return True
+        self._tail = buf[-self._keep:]
+        return False
+
+    def finish(self) -> bool:
+        return self.feed(" ")
+
+
+MATCHER = CompetitorMatcher()
+
+def contains_competitor(text: str) -> bool:
+    start = time.perf_counter()
+    found = MATCHER.contains(text)
+    COMPETITOR_CHECK.observe(time.perf_counter() - start)
+    return found
@@ -0,0 +1,122 @@
+import os, gzip
+from typing import Optional, Tuple
+
+from lru import LRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1").lower() in ("1", "true", "yes")
+COMPRESS_MIN_SIZE    = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL           = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY       = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    star = offered.get("*", 0.0)
+    candidates = (("br", brotli is not None), ("gzip", True))
+    best = None
+    best_q = 0.0
+    for enc, available in candidates:
+        q = offered.get(enc, star)
+        if available and q > best_q:
+            best, best_q = enc, q
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compresses complete (non-streamed) responses above a size threshold.
+
+    Streaming bodies pass through untouched so token deltas are not held
+    back in a compressor buffer. Responses with an ETag get a weak ETag for
+    the encoded form, and the encoded bytes are cached by (ETag, encoding).
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE, cache_entries: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self._cache = LRUCache(max_entries=cache_entries, max_bytes=8 * 1024 * 1024)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = None
+        for k, v in scope["headers"]:
+            if k == b"accept-encoding":
+                encoding = choose_encoding(v.decode("latin-1"))
+                break
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                return await send(message)
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body") or not self._compressible(held, body):
+                await send(held)
+                return await send(message)
+            encoded, headers = self._encode(held, body, encoding)
+            await send({**held, "headers": headers})
+            await send({"type": "http.response.body", "body": encoded})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compressible(self, start, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start["status"] in (204, 206, 304):
+            return False
+        ctype = b""
+        for k, v in start.get("headers", ()):
+            if k == b"content-encoding":
+                return False
+            if k == b"content-type":
+                ctype = v
+        return ctype.decode("latin-1").startswith(COMPRESSIBLE)
+
+    def _encode(self, start, body: bytes, encoding: str) -> Tuple[bytes, list]:
+        headers = []
+        etag = None
+        for k, v in start.get("headers", ()):
+            if k == b"content-length":
+                continue
+            if k == b"etag":
+                etag = v
+                v = v if v.startswith(b"W/") else b"W/" + v
+            headers.append((k, v))
+
+        encoded = self._cache.get((etag, encoding)) if etag else None
+        if encoded is None:
+            encoded = compress(body, encoding)
+            if etag:
+                self._cache.set((etag, encoding), encoded)
+        headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"content-length", str(len(encoded)).encode()))
+        headers.append((b"vary", b"Accept-Encoding"))
+        return encoded, headers
@@ -0,0 +1,219 @@
+import os, time, asyncio, logging
+from typing import Dict, List, Optional, Set
+
+from llm import get_client, limiter
+from metrics import SUMMARY_LATENCY, SUMMARY_RUNS, record_usage
+from singleflight import FLIGHTS, request_key
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - falls back to a char heuristic
+    tiktoken = None
+
+log = logging.getLogger(__name__)
+
+# Input token budget per target model (history + new message).
+CONTEXT_BUDGETS: Dict[str, int] = {
+    "gpt-4o": int(os.getenv("CONTEXT_BUDGET_GPT_4O", "16000")),
+    "gpt-4o-mini": int(os.getenv("CONTEXT_BUDGET_GPT_4O_MINI", "8000")),
+}
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("CONTEXT_BUDGET", "8000"))
+
+# Summarize once the history exceeds this share of the budget, keeping the
+# newest SUMMARY_KEEP share verbatim.
+SUMMARY_TRIGGER = float(os.getenv("SUMMARY_TRIGGER", "0.75"))
+SUMMARY_KEEP    = float(os.getenv("SUMMARY_KEEP", "0.4"))
+SUMMARY_MODEL   = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
+# Drop old turns in steps of this many messages, so the prefix sent upstream
+# stays the same for several turns and provider-side prompt caching hits.
+# Only when at least a step's worth of messages is still sent: a window
+# smaller than that is sent as it fits.
+CONTEXT_WINDOW_STEP = int(os.getenv("CONTEXT_WINDOW_STEP", "8"))
+
+# Chain turns with the Responses API's stored responses (previous_response_id)
+# and send only the new message, instead of the whole history every turn.
+RESPONSE_CHAINING = os.getenv("RESPONSE_CHAINING", "0").lower() in ("1", "true", "yes")
+RESPONSE_CHAIN_TTL = float(os.getenv("RESPONSE_CHAIN_TTL", str(7 * 24 * 3600)))
+
+MESSAGE_OVERHEAD = 4  # role/separator tokens per message
+
+_encoders: Dict[str, object] = {}   # by encoding name, not model name
+
+def _encoder(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = "o200k_base"  # unknown (e.g. client-supplied) model name
+    if name not in _encoders:
+        try:
+            _encoders[name] = tiktoken.get_encoding(name)
+        except Exception:
+            # None (BPE file unavailable, e.g. offline) is cached too: the
+            # heuristic is used rather than retrying the download per request
+            _encoders[name] = None
+    return _encoders[name]
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    enc = _encoder(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+def history_entry(role: str, content: str, model: str = "gpt-4o") -> Dict:
+    """History entry with its token count cached alongside."""
+    return {"role": role, "content": content, "tokens": count_tokens(content, model) + MESSAGE_OVERHEAD}
+
+def _tokens(m: Dict) -> int:
+    t = m.get("tokens")
+    if t is None:
+        t = m["tokens"] = count_tokens(m["content"]) + MESSAGE_OVERHEAD
+    return t
+
+def budget_for(model: str) -> int:
+    return CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+def summary_message(session: Dict) -> Optional[Dict[str, str]]:
+    if not session.get("summary"):
+        return None
+    return {"role": "system", "content": f"Summary so far:\n{session['summary']}"}
+
+def build_context(session: Dict, user_message: str, model: str) -> List[Dict[str, str]]:
+    """Summary (if any) + as many of the newest turns as fit the model's
+    budget + the new user message. Turns are never truncated mid-message."""
+    budget = budget_for(model) - count_tokens(user_message, model) - MESSAGE_OVERHEAD
+    head = summary_message(session)
+    if head is not None:
+        budget -= count_tokens(head["content"], model) + MESSAGE_OVERHEAD
+
+    history = session.get("messages", [])
+    start = len(history)
+    while start > 0 and budget - _tokens(history[start - 1]) >= 0:
+        start -= 1
+        budget -= _tokens(history[start])
+    if start and CONTEXT_WINDOW_STEP > 1:
+        rounded = -(-start // CONTEXT_WINDOW_STEP) * CONTEXT_WINDOW_STEP
+        if len(history) - rounded >= CONTEXT_WINDOW_STEP:
+            start = rounded
+
+    out = [head] if head is not None else []
+    out.extend({"role": m["role"], "content": m["content"]} for m in history[start:])
+    out.append({"role": "user", "content": user_message})
+    return out
+
+
+# --- Stored-response chaining ---
+def chain_from(session: Dict, user_message: str, model: str) -> Optional[str]:
+    """previous_response_id to continue from, or None to send the local
+    context: chaining is off, the last turn did not leave a stored response,
+    it has expired, or the chained context would outgrow the model's budget."""
+    rid = session.get("response_id")
+    if not RESPONSE_CHAINING or not rid:
+        return None
+    if time.time() - session.get("response_at", 0) > RESPONSE_CHAIN_TTL:
+        return None
+    if session.get("response_tokens", 0) + count_tokens(user_message, model) > budget_for(model):
+        return None
+    return rid
+
+def chained_input(user_message: str) -> List[Dict[str, str]]:
+    return [{"role": "user", "content": user_message}]
+
+def link_response(session: Dict, response) -> None:
+    """Remember the stored response this turn produced, or forget the chain
+    when the turn did not come from one (cache hits, the agent)."""
+    usage = getattr(response, "usage", None)
+    if RESPONSE_CHAINING and getattr(response, "id", None) and usage is not None:
+        session["response_id"] = response.id
+        session["response_at"] = time.time()
+        session["response_tokens"] = (usage.input_tokens or 0) + (usage.output_tokens or 0)
+    else:
+        for k in ("response_id", "response_at", "response_tokens"):
+            session.pop(k, None)
+
+def chain_broken(e: Exception) -> bool:
+    """The stored response we chained from is gone or unusable."""
+    return getattr(e, "status_code", None) in (400, 404) and (
+        getattr(e, "code", None) == "previous_response_not_found" or "previous_response" in str(e))
+
+
+# --- Background rolling summarization ---
+_pending: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()
+
+def _split_point(history: List[Dict], keep: int) -> int:
+    """Index of the first message kept verbatim."""
+    kept = 0
+    i = len(history)
+    while i > 0 and kept + _tokens(history[i - 1]) <= keep:
+        i -= 1
+        kept += _tokens(history[i])
+    # never split a user turn from its reply
+    if i < len(history) and history[i]["role"] == "assistant":
+        i += 1
+    return i
+
+def needs_summary(session: Dict, model: str) -> bool:
+    total = sum(_tokens(m) for m in session.get("messages", ()))
+    return total > budget_for(model) * SUMMARY_TRIGGER
+
+async def summarize(previous: Optional[str], history: List[Dict]) -> str:
+    text = "\n".join(f"{m['role']}: {m['content']}" for m in history)
+    if previous:
+        text = f"Earlier summary:\n{previous}\n\nNewer messages:\n{text}"
+
+    prompt = f"Summarize briefly (<=200 words) preserving key facts and decisions:\n\n{text}"
+
+    async def call():
+        async with limiter:
+            started = time.perf_counter()
+            rsp = await get_client().responses.create(model=SUMMARY_MODEL, input=prompt)
+        record_usage(SUMMARY_MODEL, "summary", started, rsp.usage)
+        return rsp
+
+    rsp = await FLIGHTS.do(request_key("summary", SUMMARY_MODEL, prompt), "summary", call)
+    return (rsp.output_text or "").strip()
+
+async def _condense(store, sid: str, model: str) -> None:
+    started = time.perf_counter()
+    outcome = "skipped"
+    try:
+        session = await store.load(sid)
+        history = session.get("messages", [])
+        cut = _split_point(history, int(budget_for(model) * SUMMARY_KEEP))
+        if cut <= 0:
+            return
+        head = history[:cut]
+        summary = await summarize(session.get("summary"), head)
+        if not summary:
+            return
+
+        # Turns may have been appended while we were waiting on the model;
+        # only drop the prefix we actually summarized.
+        session = await store.load(sid)
+        history = session.get("messages", [])
+        if history[:cut] != head:
+            return
+        session["summary"] = summary
+        session["messages"] = history[cut:]
+        await store.save(sid, session)
+        outcome = "ok"
+    except Exception:
+        # best effort: the context builder keeps working without a summary
+        outcome = "error"
+        log.exception("background summarization failed for session %s", sid)
+    finally:
+        _pending.discard(sid)
+        SUMMARY_RUNS.child(outcome).inc()
+        SUMMARY_LATENCY.observe(time.perf_counter() - started)
+
+def schedule_summary(store, sid: str, session: Dict, model: str) -> None:
+    """Condense older turns off the request path, at most once per session at a time."""
+    if sid in _pending or not needs_summary(session, model):
+        return
+    _pending.add(sid)
+    task = asyncio.get_running_loop().create_task(_condense(store, sid, model))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,172 @@
+import os, mmap, string, unicodedata
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from lru import LRUCache
+
+# Bundled country dataset, every ISO 3166-1 entry plus Kosovo: ISO codes,
+# names, aliases (including native and ISO names), continent, eSIM coverage
+# region and emergency numbers (left empty where none is known). It is read
+# once at import through mmap and compiled into a name -> record dict plus
+# a trigram index for misspelled names.
+COUNTRIES_PATH  = os.getenv("COUNTRIES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "countries.tsv"))
+FUZZY_THRESHOLD = float(os.getenv("COUNTRY_FUZZY_THRESHOLD", "0.5"))
+
+DEFAULT_REGION = "Global"
+NUMBER_FIELDS = ("police", "ambulance", "fire", "general")
+
+
+class Country(NamedTuple):
+    iso2: str
+    iso3: str
+    name: str
+    continent: str
+    esim_region: str
+    emergency_numbers: Dict[str, str]
+
+
+_PUNCT_TABLE = str.maketrans({c: (" " if c in "-_/,&" else "") for c in string.punctuation + "ʻ’"})
+
+def normalize_name(name: str) -> str:
+    """Casefolded, accent- and punctuation-free, single-spaced; a leading
+    "the" is dropped. "The U.S.A." -> "usa", "México" -> "mexico"."""
+    text = unicodedata.normalize("NFKD", name.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = unicodedata.normalize("NFC", text).translate(_PUNCT_TABLE)
+    words = text.split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    return " ".join(words)
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance counting an adjacent transposition as one edit."""
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class CountryIndex:
+    def __init__(self, countries: Iterable[Country], aliases: Dict[int, List[str]]):
+        self.countries: List[Country] = list(countries)
+        self._exact: Dict[str, int] = {}
+        self._names: List[str] = []          # every indexed name, for fuzzy matches
+        self._owner = array("H")             # name id -> country id
+        self._sizes = array("H")             # name id -> trigram count
+        self._grams: Dict[str, List[int]] = {}
+        for cid, c in enumerate(self.countries):
+            for name in (c.name, *aliases.get(cid, ())):
+                self._add_name(name, cid)
+            for code in (c.iso2, c.iso3):
+                self._exact.setdefault(normalize_name(code), cid)
+        self._memo = LRUCache(max_entries=4096)
+
+    @classmethod
+    def load(cls, path: str = COUNTRIES_PATH) -> "CountryIndex":
+        countries: List[Country] = []
+        aliases: Dict[int, List[str]] = {}
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            header = m.readline().decode().rstrip("\n").split("\t")
+            col = {name: i for i, name in enumerate(header)}
+            for raw in iter(m.readline, b""):
+                row = raw.decode().rstrip("\n").split("\t")
+                if len(row) < len(header):
+                    continue
+                numbers = {k: row[col[k]] for k in NUMBER_FIELDS if row[col[k]]}
+                for pair in filter(None, row[col["other"]].split("|")):
+                    k, _, v = pair.partition("=")
+                    numbers[k] = v
+                aliases[len(countries)] = [a for a in row[col["aliases"]].split("|") if a]
+                countries.append(Country(row[col["iso2"]], row[col["iso3"]], row[col["name"]],
+                                         row[col["continent"]], row[col["esim_region"]], numbers))
+        return cls(countries, aliases)
+
+    def _add_name(self, name: str, cid: int) -> None:
+        norm = normalize_name(name)
+        if not norm or norm in self._exact:
+            return
+        self._exact[norm] = cid
+        nid = len(self._names)
+        self._names.append(norm)
+        self._owner.append(cid)
+        grams = trigrams(norm)
+        self._sizes.append(len(grams))
+        for g in grams:
+            self._grams.setdefault(g, []).append(nid)
+
+    def exact(self, name: str) -> Optional[Country]:
+        cid = self._exact.get(normalize_name(name))
+        return self.countries[cid] if cid is not None else None
+
+    def fuzzy(self, name: str, threshold: float = FUZZY_THRESHOLD) -> Optional[Country]:
+        cid = self._fuzzy_id(normalize_name(name), threshold)
+        return self.countries[cid] if cid >= 0 else None
+
+    def lookup(self, name: str) -> Optional[Country]:
+        """Exact name, alias or ISO code first, then the closest fuzzy match."""
+        found = self.match(name)
+        return found[0] if found is not None else None
+
+    def match(self, name: str) -> Optional[Tuple[Country, bool]]:
+        """Like lookup(), also saying whether the country was a fuzzy match."""
+        hit = self._memo.get(name)
+        if hit is None:
+            norm = normalize_name(name)
+            cid = self._exact.get(norm)
+            hit = (cid, False) if cid is not None else (self._fuzzy_id(norm, FUZZY_THRESHOLD), True)
+            self._memo.set(name, hit, 1)
+        cid, fuzzy = hit
+        return (self.countries[cid], fuzzy) if cid >= 0 else None
+
+    def _fuzzy_id(self, norm: str, threshold: float) -> int:
+        """Country with the best trigram Dice similarity to `norm`, or -1.
+        Short names score low on trigrams after a single typo ("spian"), so
+        candidates within one or two edits also count as a match. A name
+        that is itself indexed (every ISO 3166-1 country is) only matches
+        its own country, never a neighbour an edit away ("mali", "malta")."""
+        exact = self._exact.get(norm)
+        if exact is not None:
+            return exact
+        grams = trigrams(norm)
+        shared: Dict[int, int] = {}
+        for g in grams:
+            for nid in self._grams.get(g, ()):
+                shared[nid] = shared.get(nid, 0) + 1
+        best, best_score = -1, threshold
+        for nid, n in shared.items():
+            score = 2 * n / (len(grams) + self._sizes[nid])
+            if score >= best_score:
+                best, best_score = nid, score
+        if best < 0 and len(norm) >= 4:
+            max_edits = 1 if len(norm) < 8 else 2
+            close = [(edit_distance(norm, self._names[nid]), nid) for nid, n in shared.items()
+                     if n >= 2 and abs(len(self._names[nid]) - len(norm)) <= max_edits]
+            close = [c for c in close if c[0] <= max_edits]
+            if close:
+                best = min(close)[1]
+        return self._owner[best] if best >= 0 else -1
+
+    def esim_regions(self) -> Set[str]:
+        return {c.esim_region for c in self.countries}
+
+    def stats(self):
+        return {"countries": len(self.countries), "names": len(self._exact),
+                "trigrams": len(self._grams), **{f"memo_{k}": v for k, v in self._memo.stats().items()}}
+
+
+COUNTRIES = CountryIndex.load()
+
+def esim_region(country: str) -> str:
+    c = COUNTRIES.lookup(country)
+    return c.esim_region if c is not None else DEFAULT_REGION
@@ -0,0 +1,119 @@
+import os, json, time, asyncio
+from typing import AsyncIterator, Dict, Sequence, Tuple
+
+from llm import get_client, limiter
+from lru import LRUCache
+from metrics import LLM_ERRORS, model_label, record_usage
+from singleflight import FLIGHTS, request_key
+
+# Day plans for /plan_trip. In "template" mode they are the fixed text
+# below; in "llm" mode each day is one small model call, days of a trip are
+# generated concurrently and every generated day is cached by
+# (destination, day, interests) for reuse across trips.
+ITINERARY_MODE        = os.getenv("ITINERARY_MODE", "template")   # template | llm
+ITINERARY_MODEL       = os.getenv("ITINERARY_MODEL", "gpt-4o-mini")
+ITINERARY_PARALLEL    = int(os.getenv("ITINERARY_PARALLEL", "4"))  # days generated at once per trip
+ITINERARY_MAX_ENTRIES = int(os.getenv("ITINERARY_MAX_ENTRIES", "20000"))
+ITINERARY_TTL         = float(os.getenv("ITINERARY_TTL", str(7 * 24 * 3600)))
+
+INSTRUCTIONS = (
+    "You plan one day of a trip. "
+    'Reply with a JSON object {"morning": ..., "afternoon": ..., "evening": ...}, '
+    "one or two concrete sentences each, suited to the traveller's interests. "
+    "Vary the plan with the day number so consecutive days differ."
+)
+
+DayPlan = Dict[str, str]
+SLOTS = ("morning", "afternoon", "evening")
+
+
+class ItineraryError(Exception):
+    pass
+
+
+def template_day(destination: str, interests: Sequence[str]) -> DayPlan:
+    morning_interest   = interests[0] if interests else "sightseeing"
+    afternoon_interest = interests[1] if len(interests) > 1 else morning_interest
+    evening_interest   = interests[-1] if interests else morning_interest
+    return {
+        "morning": f"Explore {destination} in the morning, focusing on {morning_interest}.",
+        "afternoon": f"Visit local attractions related to {afternoon_interest}.",
+        "evening": f"Dine at a recommended place or relax with a local activity tied to {evening_interest}.",
+    }
+
+def day_key(destination: str, day: int, interests: Sequence[str]) -> Tuple[str, int, Tuple[str, ...]]:
+    norm = lambda s: " ".join(s.split()).casefold()
+    return norm(destination), day, tuple(norm(i) for i in interests)
+
+
+class DayPlanner:
+    def __init__(self, mode: str = ITINERARY_MODE, model: str = ITINERARY_MODEL,
+                 parallel: int = ITINERARY_PARALLEL, max_entries: int = ITINERARY_MAX_ENTRIES,
+                 ttl: float = ITINERARY_TTL):
+        self.mode = mode
+        self.model = model
+        self.parallel = max(parallel, 1)
+        self.generated = 0
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    async def day(self, destination: str, day: int, interests: Sequence[str]) -> DayPlan:
+        if self.mode == "template":
+            return template_day(destination, interests)
+        key = day_key(destination, day, interests)
+        plan = self.cache.get(key)
+        if plan is None:
+            plan = await FLIGHTS.do(request_key("itinerary_day", self.model, *key), "itinerary",
+                                    lambda: self._generate(key, destination, day, interests))
+        return plan
+
+    async def days(self, destination: str, days: int, interests: Sequence[str]) -> AsyncIterator[Tuple[int, DayPlan]]:
+        """(day, plan) pairs in completion order, at most `parallel` generating at once."""
+        sem = asyncio.Semaphore(self.parallel)
+
+        async def one(day: int) -> Tuple[int, DayPlan]:
+            async with sem:
+                return day, await self.day(destination, day, interests)
+
+        tasks = [asyncio.ensure_future(one(d)) for d in range(1, days + 1)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def itinerary(self, destination: str, days: int, interests: Sequence[str]) -> Dict[str, DayPlan]:
+        plans = dict([item async for item in self.days(destination, days, interests)])
+        return {f"Day {d}": plans[d] for d in range(1, days + 1)}
+
+    async def _generate(self, key, destination: str, day: int, interests: Sequence[str]) -> DayPlan:
+        payload = {"destination": destination, "day": day, "interests": list(interests)}
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                rsp = await get_client().responses.create(
+                    model=self.model,
+                    instructions=INSTRUCTIONS,
+                    input=json.dumps(payload, ensure_ascii=False),
+                    text={"format": {"type": "json_object"}},
+                )
+            except Exception as e:
+                LLM_ERRORS.child(model_label(self.model), "itinerary").inc()
+                raise ItineraryError(str(e)) from e
+        record_usage(self.model, "itinerary", started, rsp.usage)
+        try:
+            plan = json.loads(rsp.output_text)
+        except ValueError:
+            raise ItineraryError("Malformed day plan")
+        if not isinstance(plan, dict) or not all(isinstance(plan.get(s), str) for s in SLOTS):
+            raise ItineraryError("Day plan is missing morning, afternoon or evening")
+        plan = {s: plan[s].strip() for s in SLOTS}
+        self.cache.set(key, plan, 1)
+        self.generated += 1
+        return plan
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.cache.stats(), "generated": self.generated}
+
+
+PLANNER = DayPlanner()
@@ -0,0 +1,105 @@
+import os, asyncio, threading
+from typing import TYPE_CHECKING, Optional
+from fastapi import HTTPException
+from metrics import register_stats
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+# --- Upstream HTTP pool ---
+LLM_MAX_CONNECTIONS  = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE    = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT  = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT     = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+
+# --- Upstream concurrency cap ---
+LLM_MAX_CONCURRENCY  = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE        = int(os.getenv("LLM_MAX_QUEUE", "128"))
+LLM_QUEUE_TIMEOUT    = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# The openai package takes ~0.4s to import, so the client is built on first
+# use (or by the startup warm-up) rather than when the app is imported.
+http_client: Optional["httpx.AsyncClient"] = None
+_client: Optional["AsyncOpenAI"] = None
+_unretried: Optional[tuple] = None   # (client it was derived from, copy without SDK retries)
+_client_lock = threading.Lock()
+
+def get_client(retries: bool = True) -> "AsyncOpenAI":
+    """The shared client. retries=False gives a copy of it, on the same pool,
+    without the SDK's own retries, for callers that retry themselves."""
+    global http_client, _client, _unretried
+    if _client is None:
+        with _client_lock:  # the warm-up may build it from a worker thread
+            if _client is None:
+                import httpx
+                from openai import AsyncOpenAI
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                )
+                _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+    if retries:
+        return _client
+    client = _client
+    if _unretried is None or _unretried[0] is not client:
+        _unretried = (client, client.with_options(max_retries=0))
+    return _unretried[1]
+
+
+class UpstreamLimiter:
+    """Caps concurrent upstream calls; callers wait in a bounded FIFO queue."""
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # created lazily so it binds to the serving event loop
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            raise HTTPException(503, "Upstream queue is full", headers={"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(503, "Timed out waiting for upstream capacity", headers={"Retry-After": "1"})
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._sem.release()
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "max_queue": self.max_queue}
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+limiter = UpstreamLimiter(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
+register_stats("llm_limiter", "Upstream concurrency limiter", limiter.stats)
+
+
+async def aclose() -> None:
+    global _client, _unretried
+    if _client is not None:
+        await _client.close()
+        _client = None
+        _unretried = None
@@ -0,0 +1,111 @@
+import os, json, time, sqlite3, asyncio, hashlib, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from competitor import contains_competitor
+from lru import LRUCache
+from profiler import phase
+
+# Opt-in cache of final chat replies, keyed on everything that shapes them:
+# model, max_output_tokens and the (normalized) context sent upstream.
+LLM_CACHE             = os.getenv("LLM_CACHE", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL         = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES   = int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+LLM_CACHE_PATH        = os.getenv("LLM_CACHE_PATH", "")   # SQLite file; empty keeps it in memory only
+
+ENTRY_OVERHEAD = 150  # key, expiry and bookkeeping per entry, roughly
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+def cache_key(model: str, max_output_tokens: int, messages: List[Dict[str, str]]) -> str:
+    context = [[m["role"], _normalize(m["content"])] for m in messages]
+    raw = json.dumps([model, max_output_tokens, context], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def cacheable(text: str) -> bool:
+    with phase("guard"):
+        return bool(text) and not contains_competitor(text)
+
+
+class LLMCache:
+    """LRU over (text, expires_at) with a byte budget. With a path, entries
+    are also written through to SQLite and loaded back on startup."""
+
+    PURGE_EVERY = 256
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, path: str = LLM_CACHE_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stores = 0
+        self.rejected = 0
+        # wall-clock expiry per entry, so entries loaded from disk keep theirs
+        self._lru = LRUCache(max_entries=max_entries, max_bytes=max_bytes,
+                             sizeof=lambda e: len(e[0].encode()) + ENTRY_OVERHEAD)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        if path:
+            self._open(path)
+
+    def get(self, key: str) -> Optional[str]:
+        entry: Optional[Tuple[str, float]] = self._lru.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            self._lru.pop(key)
+            self._lru.expirations += 1
+            return None
+        return entry[0]
+
+    async def set(self, key: str, text: str) -> None:
+        if not cacheable(text):
+            self.rejected += 1
+            return
+        expires = time.time() + self.ttl
+        self._lru.set(key, (text, expires))
+        self.stores += 1
+        if self._db is not None:
+            await asyncio.to_thread(self._write, key, text, expires)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._lru.stats(), "stores": self.stores, "rejected": self.rejected,
+                "persistent": self._db is not None}
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def _open(self, path: str) -> None:
+        db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                   " key TEXT PRIMARY KEY, text TEXT NOT NULL, expires REAL NOT NULL)")
+        db.execute("DELETE FROM llm_cache WHERE expires < ?", (time.time(),))
+        # oldest first, so the LRU ends up with the freshest entries most recent
+        rows = db.execute("SELECT key, text, expires FROM llm_cache ORDER BY expires DESC LIMIT ?",
+                          (self.max_entries or -1,)).fetchall()
+        for key, text, expires in reversed(rows):
+            self._lru.set(key, (text, expires))
+        self._db = db
+
+    def _write(self, key: str, text: str, expires: float) -> None:
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute("INSERT OR REPLACE INTO llm_cache (key, text, expires) VALUES (?, ?, ?)",
+                             (key, text, expires))
+            if self.stores % self.PURGE_EVERY:
+                return
+            self._db.execute("DELETE FROM llm_cache WHERE expires < ?", (time.time(),))
+            if self.max_entries:
+                self._db.execute("DELETE FROM llm_cache WHERE key IN ("
+                                 " SELECT key FROM llm_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_entries,))
+
+
+LLM_RESPONSES: Optional[LLMCache] = LLMCache() if LLM_CACHE else None
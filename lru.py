@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """OrderedDict-backed LRU with optional TTL and byte budget.
+
+    Not thread-safe; meant to be used from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, ttl: float = 0,
+                 sizeof: Callable[[Any], int] = len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (value, size, expires_at)
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            if count:
+                self.misses += 1
+            return None
+        if item[2] and item[2] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            if count:
+                self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        if size is None:
+            size = self.sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            self.pop(key)
+            return
+        if key in self._data:
+            self._remove(key)
+        expires = time.monotonic() + self.ttl if self.ttl else 0.0
+        self._data[key] = (value, size, expires)
+        self.bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        if key not in self._data:
+            return None
+        return self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def purge_expired(self) -> int:
+        if not self.ttl:
+            return 0
+        now = time.monotonic()
+        # entries are in recency order, not expiry order, so scan them all
+        expired = [k for k, (_, _, exp) in self._data.items() if exp < now]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: Hashable) -> Any:
+        value, size, _ = self._data.pop(key)
+        self.bytes -= size
+        return value
+
+    def _evict(self) -> None:
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self.bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
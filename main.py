@@ -1,16 +1,79 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, constr
-from typing import List, Dict, Literal, Optional
-import string
-
-
-
-
-app = FastAPI(title="Qrispy TravelBuddy API", version="0.1.2")
-
-from routes_chat import router as chat_router
+from pydantic import BaseModel, Field, ValidationError, constr
+from typing import Any, Awaitable, Callable, List, Dict, Literal, NamedTuple, Optional, Type, Union
+import os, json, time, asyncio, inspect, logging
+from contextlib import asynccontextmanager
+import pydantic_core
+from competitor import contains_competitor
+from countries import COUNTRIES, DEFAULT_REGION, esim_region
+from translation import TRANSLATOR, TranslationError
+from itinerary import PLANNER, ItineraryError, template_day
+from tool_cache import TOOL_CACHE
+from metrics import MetricsMiddleware, register_stats, router as metrics_router
+from serialization import json_response, render
+from compression import CompressionMiddleware, RESPONSE_COMPRESSION
+from context import CONTEXT_BUDGETS, count_tokens
+from llm import aclose as llm_aclose, get_client
+from llm_cache import LLM_RESPONSES
+from profiler import ProfilerMiddleware, mark, phase, router as profiler_router
+
+log = logging.getLogger(__name__)
+
+# --- Startup ---
+# The upstream client and the lazy caches are prepared in the background once
+# the app is serving. With WARMUP=1 pooled upstream connections are opened
+# too, and /health answers 503 until all of it is done, so the platform only
+# routes traffic to a warm instance.
+WARMUP             = os.getenv("WARMUP", "0").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+WARMUP_TIMEOUT     = float(os.getenv("WARMUP_TIMEOUT", "20"))
+
+STARTUP: Dict[str, Any] = {"ready": not WARMUP, "warmup_s": None}
+
+async def warmup(connect: bool = WARMUP) -> None:
+    started = time.perf_counter()
+    try:
+        client = await asyncio.to_thread(get_client)
+        await asyncio.to_thread(lambda: [count_tokens("", m) for m in CONTEXT_BUDGETS])
+        agent_tools()
+        if connect:
+            # each concurrent request leaves one keep-alive connection in the pool
+            results = await asyncio.wait_for(
+                asyncio.gather(*(client.models.list() for _ in range(WARMUP_CONNECTIONS)), return_exceptions=True),
+                WARMUP_TIMEOUT,
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    log.warning("warm-up connection failed: %s", r)
+    except Exception:
+        log.exception("warm-up failed")
+    finally:
+        STARTUP["ready"] = True
+        STARTUP["warmup_s"] = round(time.perf_counter() - started, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.ensure_future(warmup())
+    yield
+    task.cancel()
+    await llm_aclose()
+    await STORE.close()
+    if LLM_RESPONSES is not None:
+        LLM_RESPONSES.close()
+
+
+app = FastAPI(title="Qrispy TravelBuddy API", version="0.1.2", lifespan=lifespan)
+
+from routes_chat import STORE, router as chat_router
+from routes_agent import _tools as agent_tools, router as agent_router
+from routes_ws import router as ws_router
 app.include_router(chat_router) 
+app.include_router(agent_router)
+app.include_router(ws_router)
+app.include_router(metrics_router)
+app.include_router(profiler_router)
 # --- CORS ---
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +82,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # --- Types ---
 CountryStr = constr(strip_whitespace=True, min_length=2, max_length=64)
@@ -37,6 +104,9 @@ class TripRequest(BaseModel):
     days: int = Field(ge=1, le=30)
     interests: List[constr(strip_whitespace=True, min_length=1)] = Field(default_factory=list)
 
+class TripStreamRequest(TripRequest):
+    format: Literal["ndjson", "sse"] = "ndjson"
+
 class DayPlan(BaseModel):
     morning: str
     afternoon: str
@@ -72,9 +142,10 @@ class SafetyRequest(BaseModel):
 
 class SafetyResponse(BaseOK):
     country: str
+    matched: Optional[str] = None    # the dataset country the name resolved to
     emergency_numbers: Dict[str, str]
     tips: str
-    source: Literal["mock"]
+    source: Literal["dataset", "fuzzy", "mock"]
 
 class TranslationRequest(BaseModel):
     phrase: constr(strip_whitespace=True, min_length=1)
@@ -85,6 +156,20 @@ class TranslationResponse(BaseOK):
     language: str
     translation: str
 
+MAX_TRANSLATION_BATCH = int(os.getenv("MAX_TRANSLATION_BATCH", "50"))
+
+class TranslationBatchRequest(BaseModel):
+    phrases: List[constr(strip_whitespace=True, min_length=1)] = Field(min_length=1, max_length=MAX_TRANSLATION_BATCH)
+    target_language: LangStr
+
+class PhraseTranslation(BaseModel):
+    original: str
+    translation: str
+
+class TranslationBatchResponse(BaseOK):
+    language: str
+    translations: List[PhraseTranslation]
+
 class LocalEventsRequest(BaseModel):
     city: CityStr
 
@@ -101,116 +186,289 @@ class ConversationResponse(BaseOK):
     response: Optional[str] = None
     reply: Optional[str] = None
 
+MAX_TOOL_BATCH = int(os.getenv("MAX_TOOL_BATCH", "16"))
+
+class ToolCall(BaseModel):
+    name: str
+    arguments: Dict[str, Any] = Field(default_factory=dict)
+
+class ToolBatchRequest(BaseModel):
+    calls: List[ToolCall] = Field(min_length=1, max_length=MAX_TOOL_BATCH)
+
+class ToolResult(BaseModel):
+    name: str
+    ok: bool
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+
+class ToolBatchResponse(BaseOK):
+    results: List[ToolResult]
+
 # --- Utils ---
-_COMPETITOR_KEYWORDS = {
-    "airalo","airhub","betterroaming","bnesim","bytesim","dent","digital republic",
-    "easysim","escapesim","esim.sm","esim2fly","esim4travel","esimatic","esim-man",
-    "esimple","esimplus","esimx","etravelsim","ezsim","flexiroam","gigago","gigsky",
-    "global yo","globalesim","gomoworld","ifree mogo","instabridge esim","jetpac",
-    "keepgo","knowroaming","kolet","manet travel","maya mobile","microesim","mobimatter",
-    "monty esim","mtx connect","nomad","northsim","rapidesim","redteago","roamify",
-    "saily","simoptions","soracom mobile","stork mobile","taro mobile","textr esim",
-    "travelkon","trifa","truphone","ubigi","upesim","webbing","wifi map","yesim",
-    "yoho mobile","roamless","honest"
+def infer_region(country: str) -> str:
+    return esim_region(country)
+
+# --- Tool builders ---
+# Builders return plain dicts shaped like their response models; they are
+# serialized once, through serialization.render().
+def build_trip(req: TripRequest) -> Dict[str, Any]:
+    # every day gets the same plan
+    plan = template_day(req.destination, req.interests)
+    itinerary = {f"Day {day}": plan for day in range(1, req.days + 1)}
+    return {"success": True, "destination": req.destination, "days": req.days, "itinerary": itinerary}
+
+async def build_generated_trip(req: TripRequest) -> Dict[str, Any]:
+    try:
+        itinerary = await PLANNER.itinerary(req.destination, req.days, req.interests)
+    except ItineraryError as e:
+        raise HTTPException(502, f"Itinerary unavailable: {e}")
+    return {"success": True, "destination": req.destination, "days": req.days, "itinerary": itinerary}
+
+async def stream_trip(req: TripStreamRequest):
+    """One JSON object per day as soon as it is ready (in completion order),
+    then a final {"done": true}; a failure ends the stream with {"error"}."""
+    def line(kind: str, obj: Dict[str, Any]) -> bytes:
+        data = pydantic_core.to_json(obj)
+        return b"event: " + kind.encode() + b"\ndata: " + data + b"\n\n" if req.format == "sse" else data + b"\n"
+
+    try:
+        async for day, plan in PLANNER.days(req.destination, req.days, req.interests):
+            yield line("day", {"day": day, "label": f"Day {day}", "plan": plan})
+    except (ItineraryError, HTTPException) as e:
+        yield line("error", {"error": f"Itinerary unavailable: {getattr(e, 'detail', e)}"})
+        return
+    yield line("done", {"done": True, "destination": req.destination, "days": req.days})
+
+def _esim_plans(region: str) -> List[Dict[str, str]]:
+    return [
+        dict(name="Qrispy Go", type="Pay-as-you-go", data="Flexible (user top-up)",
+             price="Based on usage", coverage="Global", duration="No expiry",
+             activation="Whenever user activates", segment="Frequent travellers, flexibility, value"),
+        dict(name="Qrispy Data Plan", type="Package", data="1-3-5-10-20GB",
+             price="Varies by region", coverage="Country/Region", duration="Day, Week, 2 Weeks, Month",
+             activation="When user arrives", segment="One-off, cost-conscious"),
+        dict(name="Qrispy Unlimited Plan", type="Unlimited Package",
+             data="1/2/3 GB per day, then throttled", price="Subscription or flat rate",
+             coverage=region, duration="Daily/Weekly/Monthly", activation="When user arrives",
+             segment="Users who want no limits"),
+        dict(name="Qrispy Multi Plan", type="Pack+", data="30-40-60GB (shared)",
+             price="Varies", coverage=region, duration="Day, Week, 2 Weeks, Month",
+             activation="When user arrives", segment="Families, Friends, Nomads, Teams"),
+        dict(name="Qrispy Global Membership", type="Subscription", data="Unlimited or fixed",
+             price="Monthly/Yearly", coverage=region, duration="Subscription-based",
+             activation="When user arrives", segment="Expats, Students, Digital Nomads"),
+    ]
+
+register_stats("tool_cache", "Tool response cache", TOOL_CACHE.stats)
+register_stats("countries", "Country index", COUNTRIES.stats)
+register_stats("translation", "Translation memory", TRANSLATOR.stats)
+register_stats("itinerary", "Generated day plans", PLANNER.stats)
+
+# eSIM catalogs only depend on the region; build them once at startup.
+ESIM_CATALOGS: Dict[str, List[Dict[str, str]]] = {r: _esim_plans(r) for r in COUNTRIES.esim_regions() | {DEFAULT_REGION}}
+
+def esim_catalog(region: str) -> List[Dict[str, str]]:
+    if region not in ESIM_CATALOGS:
+        ESIM_CATALOGS[region] = _esim_plans(region)
+    return ESIM_CATALOGS[region]
+
+def build_esim_options(req: ESIMRequest) -> Dict[str, Any]:
+    if not req.country or not req.device:
+        return {"success": False, "country": req.country, "device": req.device, "region": "Unknown", "plans": []}
+    region = infer_region(req.country)
+    return {"success": True, "country": req.country, "device": req.device, "region": region,
+            "plans": esim_catalog(region)}
+
+def build_safety_info(req: SafetyRequest) -> Dict[str, Any]:
+    found = COUNTRIES.match(req.country)
+    country, fuzzy = found if found is not None else (None, False)
+    if country is None or not country.emergency_numbers:
+        # 112 reaches emergency services from any GSM phone in most countries
+        numbers, source = {"general": "112"}, "mock"
+    else:
+        # a misspelled name resolves to its closest country; say which one
+        numbers, source = country.emergency_numbers, "fuzzy" if fuzzy else "dataset"
+    name = country.name if country is not None else req.country
+    return {
+        "success": True,
+        "country": req.country,
+        "matched": country.name if country is not None else None,
+        "emergency_numbers": numbers,
+        "tips": f"Be aware of local customs and keep emergency contacts saved while traveling in {name}.",
+        "source": source,
+    }
+
+def build_local_events(req: LocalEventsRequest) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "city": req.city,
+        "events": [
+            f"Food Festival in {req.city}",
+            f"Live music concert in central {req.city}",
+            f"Open-air art market this weekend in {req.city}"
+        ],
+    }
+
+async def build_translation(req: TranslationRequest) -> Dict[str, Any]:
+    try:
+        text = await TRANSLATOR.translate(req.phrase, req.target_language)
+    except TranslationError as e:
+        raise HTTPException(502, f"Translation unavailable: {e}")
+    return {"success": True, "original": req.phrase, "language": req.target_language, "translation": text}
+
+async def build_translations(req: TranslationBatchRequest) -> Dict[str, Any]:
+    try:
+        texts = await TRANSLATOR.translate_many(req.phrases, req.target_language)
+    except TranslationError as e:
+        raise HTTPException(502, f"Translation unavailable: {e}")
+    return {
+        "success": True,
+        "language": req.target_language,
+        "translations": [{"original": p, "translation": t} for p, t in zip(req.phrases, texts)],
+    }
+
+def build_conversation(req: ConversationRequest) -> Dict[str, Any]:
+    with phase("guard"):
+        blocked = contains_competitor(req.message)
+    if blocked:
+        return {
+            "success": False,
+            "allowed": False,
+            "reason": "competitor_detected",
+            "response": "Sorry, I can't help with questions about competitors. Let me know how I can assist with your travel plans instead!",
+            "reply": None,
+        }
+    return {"success": True, "allowed": True, "reason": None, "response": None,
+            "reply": "Your message is allowed. How can I help you further?"}
+
+# --- Tool registry ---
+# Shared by the HTTP routes, /tools/invoke and in-process callers.
+TRIP_GENERATED = PLANNER.mode != "template"
+
+class Tool(NamedTuple):
+    request: Type[BaseModel]
+    response: Type[BaseModel]
+    build: Callable[[Any], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+    cached: bool
+    description: str
+
+TOOLS: Dict[str, Tool] = {
+    # generated days are cached per day by the planner rather than per trip
+    "plan_trip": Tool(TripRequest, TripResponse, build_generated_trip if TRIP_GENERATED else build_trip, not TRIP_GENERATED,
+        "Creates a travel itinerary based on city, number of days, and interests."),
+    "get_esim_options": Tool(ESIMRequest, ESIMResponse, build_esim_options, True,
+        "Returns eSIM plan options based on country and device type."),
+    "get_safety_info": Tool(SafetyRequest, SafetyResponse, build_safety_info, True,
+        "Provides emergency numbers and local safety tips for a given country."),
+    "get_translation": Tool(TranslationRequest, TranslationResponse, build_translation, False,
+        "Translates a phrase into the selected target language."),
+    "get_translations": Tool(TranslationBatchRequest, TranslationBatchResponse, build_translations, False,
+        "Translates several phrases into the selected target language in one call."),
+    "get_local_events": Tool(LocalEventsRequest, LocalEventsResponse, build_local_events, True,
+        "Returns popular local events happening in a city."),
+    "conversation": Tool(ConversationRequest, ConversationResponse, build_conversation, False,
+        "Checks whether a user message is allowed (e.g. no competitor questions)."),
 }
-_PUNCT_TABLE = str.maketrans({c: " " for c in string.punctuation})
 
-def contains_competitor(text: str) -> bool:
-    norm = text.casefold().translate(_PUNCT_TABLE)
-    tokens = {t for t in norm.split() if t}
-    if any(" " in kw and kw in norm for kw in _COMPETITOR_KEYWORDS):
-        return True
-    return any(kw in tokens for kw in _COMPETITOR_KEYWORDS if " " not in kw)
+def tool_schemas() -> List[Dict[str, Any]]:
+    """Function-calling schemas generated from the request models."""
+    return [
+        {"type": "function", "function": {
+            "name": name, "description": t.description, "parameters": t.request.model_json_schema()}}
+        for name, t in TOOLS.items()
+    ]
 
-def infer_region(country: str) -> str:
-    c = country.casefold()
-    if c in {"usa","united states","united states of america","canada","mexico"}:
-        return "North America"
-    if c in {"france","germany","italy","spain","uk","united kingdom","england","scotland"}:
-        return "Europe"
-    return "Global"
+class UnknownTool(KeyError):
+    pass
+
+async def invoke_tool(name: str, arguments: Dict[str, Any]) -> bytes:
+    """Validate `arguments` with the tool's request model and return the
+    JSON response body. Raises UnknownTool or pydantic.ValidationError."""
+    tool = TOOLS.get(name)
+    if tool is None:
+        raise UnknownTool(name)
+    req = tool.request.model_validate(arguments)
+    if tool.cached:
+        return TOOL_CACHE.get(name, req, tool.response, tool.build).body
+    rsp = tool.build(req)
+    if inspect.isawaitable(rsp):
+        rsp = await rsp
+    return render(tool.response, rsp)
+
+def tool_error(e: Exception) -> Dict[str, Any]:
+    if isinstance(e, UnknownTool):
+        return {"type": "unknown_tool", "detail": f"Unknown tool: {e.args[0]}"}
+    if isinstance(e, ValidationError):
+        return {"type": "validation_error", "detail": e.errors(include_url=False, include_context=False)}
+    if isinstance(e, HTTPException):
+        return {"type": "http_error", "status": e.status_code, "detail": e.detail}
+    return {"type": "internal_error", "detail": str(e)}
+
+async def _invoke_entry(call: ToolCall) -> bytes:
+    name = json.dumps(call.name).encode()
+    try:
+        body = await invoke_tool(call.name, call.arguments)
+        return b'{"name":' + name + b',"ok":true,"result":' + body + b'}'
+    except Exception as e:
+        return b'{"name":' + name + b',"ok":false,"error":' + pydantic_core.to_json(tool_error(e)) + b'}'
 
 # --- Routes ---
 @app.get("/health")
 def health():
+    if not STARTUP["ready"]:
+        return json_response(b'{"status":"starting"}', status_code=503, headers={"Retry-After": "1"})
     return {"status": "ok"}
 
+# The deterministic tool endpoints are served from TOOL_CACHE as ready-made
+# JSON bytes with an ETag; the others are rendered once per request. Either
+# way response_model only drives the OpenAPI schema.
 @app.post("/plan_trip", response_model=TripResponse)
-async def plan_trip(req: TripRequest):
-    itinerary: Dict[str, DayPlan] = {}
-    for day in range(1, req.days + 1):
-        morning_interest   = req.interests[0] if req.interests else "sightseeing"
-        afternoon_interest = req.interests[1] if len(req.interests) > 1 else morning_interest
-        evening_interest   = req.interests[-1] if req.interests else morning_interest
-        itinerary[f"Day {day}"] = DayPlan(
-            morning=f"Explore {req.destination} in the morning, focusing on {morning_interest}.",
-            afternoon=f"Visit local attractions related to {afternoon_interest}.",
-            evening=f"Dine at a recommended place or relax with a local activity tied to {evening_interest}."
-        )
-    return TripResponse(destination=req.destination, days=req.days, itinerary=itinerary)
+async def plan_trip(req: TripRequest, request: Request):
+    mark("parse")
+    if not TRIP_GENERATED:
+        return TOOL_CACHE.respond(request, "plan_trip", req, TripResponse, build_trip)
+    with phase("upstream"):
+        trip = await build_generated_trip(req)
+    return json_response(render(TripResponse, trip))
+
+@app.post("/plan_trip/stream")
+async def plan_trip_stream(req: TripStreamRequest):
+    media_type = "text/event-stream" if req.format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream_trip(req), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/get_esim_options", response_model=ESIMResponse)
-async def get_esim_options(req: ESIMRequest):
-    if not req.country or not req.device:
-        return ESIMResponse(success=False, country=req.country, device=req.device, region="Unknown", plans=[])
-    region = infer_region(req.country)
-    plans = [
-        ESIMPlan(name="Qrispy Go", type="Pay-as-you-go", data="Flexible (user top-up)",
-                 price="Based on usage", coverage="Global", duration="No expiry",
-                 activation="Whenever user activates", segment="Frequent travellers, flexibility, value"),
-        ESIMPlan(name="Qrispy Data Plan", type="Package", data="1-3-5-10-20GB",
-                 price="Varies by region", coverage="Country/Region", duration="Day, Week, 2 Weeks, Month",
-                 activation="When user arrives", segment="One-off, cost-conscious"),
-        ESIMPlan(name="Qrispy Unlimited Plan", type="Unlimited Package",
-                 data="1/2/3 GB per day, then throttled", price="Subscription or flat rate",
-                 coverage=region, duration="Daily/Weekly/Monthly", activation="When user arrives",
-                 segment="Users who want no limits"),
-        ESIMPlan(name="Qrispy Multi Plan", type="Pack+", data="30-40-60GB (shared)",
-                 price="Varies", coverage=region, duration="Day, Week, 2 Weeks, Month",
-                 activation="When user arrives", segment="Families, Friends, Nomads, Teams"),
-        ESIMPlan(name="Qrispy Global Membership", type="Subscription", data="Unlimited or fixed",
-                 price="Monthly/Yearly", coverage=region, duration="Subscription-based",
-                 activation="When user arrives", segment="Expats, Students, Digital Nomads"),
-    ]
-    return ESIMResponse(country=req.country, device=req.device, region=region, plans=plans)
+async def get_esim_options(req: ESIMRequest, request: Request):
+    return TOOL_CACHE.respond(request, "get_esim_options", req, ESIMResponse, build_esim_options)
 
 @app.post("/get_safety_info", response_model=SafetyResponse)
-async def get_safety_info(req: SafetyRequest):
-    return SafetyResponse(
-        country=req.country,
-        emergency_numbers={"police": "112", "ambulance": "113", "fire": "114"},
-        tips=f"Be aware of local customs and keep emergency contacts saved while traveling in {req.country}.",
-        source="mock",
-    )
+async def get_safety_info(req: SafetyRequest, request: Request):
+    return TOOL_CACHE.respond(request, "get_safety_info", req, SafetyResponse, build_safety_info)
 
 @app.post("/get_translation", response_model=TranslationResponse)
 async def get_translation(req: TranslationRequest):
-    return TranslationResponse(
-        original=req.phrase,
-        language=req.target_language,
-        translation=f"Translated '{req.phrase}' to {req.target_language}."
-    )
+    return json_response(render(TranslationResponse, await build_translation(req)))
+
+@app.post("/get_translations", response_model=TranslationBatchResponse)
+async def get_translations(req: TranslationBatchRequest):
+    return json_response(render(TranslationBatchResponse, await build_translations(req)))
 
 @app.post("/get_local_events", response_model=LocalEventsResponse)
-async def get_local_events(req: LocalEventsRequest):
-    return LocalEventsResponse(
-        city=req.city,
-        events=[
-            f"Food Festival in {req.city}",
-            f"Live music concert in central {req.city}",
-            f"Open-air art market this weekend in {req.city}"
-        ]
-    )
+async def get_local_events(req: LocalEventsRequest, request: Request):
+    return TOOL_CACHE.respond(request, "get_local_events", req, LocalEventsResponse, build_local_events)
 
 @app.post("/conversation", response_model=ConversationResponse)
 async def conversation(req: ConversationRequest):
-    if contains_competitor(req.message):
-        return ConversationResponse(
-            success=False,
-            allowed=False,
-            reason="competitor_detected",
-            response="Sorry, I can't help with questions about competitors. Let me know how I can assist with your travel plans instead!",
-        )
-    return ConversationResponse(allowed=True, reply="Your message is allowed. How can I help you further?")
-
-
+    mark("parse")
+    return json_response(render(ConversationResponse, build_conversation(req)))
+
+@app.post("/tools/invoke", response_model=ToolBatchResponse)
+async def invoke_tools(req: ToolBatchRequest):
+    """Run several tool calls in one round trip. Results come back in call
+    order; a failing call reports its error without failing the batch."""
+    parts = await asyncio.gather(*(_invoke_entry(c) for c in req.calls))
+    return json_response(b'{"success":true,"results":[' + b",".join(parts) + b"]}")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return TOOL_CACHE.stats()
@@ -0,0 +1,261 @@
+import os, time
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# Prometheus-style metrics without a client library.
+#
+# Each label combination gets its metric object once; after that, recording
+# a sample is an in-place update (a bisect plus an array slot for
+# histograms). The HTTP middleware resolves a route's metrics on its first
+# request and reuses them, so the per-request path builds no label tuples,
+# strings or sample objects.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS    = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3)
+RATE_BUCKETS    = (5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+# Upstream model names come from clients; anything not listed is reported as
+# "other" to keep label cardinality bounded.
+KNOWN_MODELS = {"gpt-4o", "gpt-4o-mini", *filter(None, os.getenv("METRICS_MODELS", "").split(","))}
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, n: float = 1) -> None:
+        self.value += n
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{labels} {_num(self.value)}"
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def dec(self, n: float = 1) -> None:
+        self.value -= n
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = array("Q", [0] * (len(self.buckets) + 1))  # last slot is +Inf
+        self.total = array("d", [0.0])
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.total[0] += v
+
+    def samples(self, name: str, labels: str):
+        inner = labels[1:-1] + "," if labels else ""
+        acc = 0
+        for le, n in zip(self.buckets, self.counts):
+            acc += n
+            yield f'{name}_bucket{{{inner}le="{_num(le)}"}} {acc}'
+        acc += self.counts[-1]
+        yield f'{name}_bucket{{{inner}le="+Inf"}} {acc}'
+        yield f"{name}_sum{labels} {_num(self.total[0])}"
+        yield f"{name}_count{labels} {acc}"
+
+
+class Family:
+    """A metric with labels; child(*values) resolves through one dict per
+    label and creates the metric on first use."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str] = (),
+                 factory: Callable[[], Any] = Counter):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self._children: Dict[str, Any] = {}
+        self._flat: List[Tuple[Tuple[str, ...], Any]] = []
+        if not self.labelnames:
+            self._root = self._make(())
+
+    def _make(self, values: Tuple[str, ...]):
+        metric = self.factory()
+        self._flat.append((values, metric))
+        return metric
+
+    def child(self, *values: str):
+        if not values:
+            return self._root
+        node = self._children
+        for v in values[:-1]:
+            nxt = node.get(v)
+            if nxt is None:
+                nxt = node[v] = {}
+            node = nxt
+        metric = node.get(values[-1])
+        if metric is None:
+            metric = node[values[-1]] = self._make(tuple(values))
+        return metric
+
+    def __getattr__(self, attr):
+        # unlabelled families proxy straight to their single metric
+        root = self.__dict__.get("_root")
+        if root is None:
+            raise AttributeError(attr)
+        return getattr(root, attr)
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, metric in self._flat:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values))
+            yield from metric.samples(self.name, "{" + labels + "}" if labels else "")
+
+
+REGISTRY: List[Family] = []
+COLLECTORS: List[Tuple[str, str, Callable[[], Dict[str, Any]]]] = []
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Family:
+    return _register(Family(name, help, "counter", labels, Counter))
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Family:
+    return _register(Family(name, help, "gauge", labels, Gauge))
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Family:
+    return _register(Family(name, help, "histogram", labels, lambda: Histogram(buckets)))
+
+def _register(f: Family) -> Family:
+    REGISTRY.append(f)
+    return f
+
+def register_stats(prefix: str, help: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    """Expose the numeric fields of fn() as `<prefix>_<field>` gauges, read at scrape time."""
+    COLLECTORS.append((prefix, help, fn))
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def model_label(model: str) -> str:
+    return model if model in KNOWN_MODELS else "other"
+
+def render() -> str:
+    lines: List[str] = []
+    for f in REGISTRY:
+        lines.extend(f.expose())
+    for prefix, help, fn in COLLECTORS:
+        try:
+            stats = fn()
+        except Exception:
+            continue
+        for k, v in stats.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                lines.append(f"# HELP {prefix}_{k} {help}: {k}")
+                lines.append(f"# TYPE {prefix}_{k} gauge")
+                lines.append(f"{prefix}_{k} {_num(v)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metric definitions ---
+HTTP_LATENCY   = histogram("http_request_duration_seconds", "Request latency by route, including streamed bodies.", ["route", "method"])
+HTTP_REQUESTS  = counter("http_requests_total", "Requests by route and status class.", ["route", "method", "status"])
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "Requests currently being served.")
+
+LLM_LATENCY    = histogram("llm_request_duration_seconds", "Upstream LLM call duration.", ["model", "kind"])
+LLM_TTFT       = histogram("llm_time_to_first_token_seconds", "Time to the first streamed token.", ["model", "kind"])
+LLM_TOKENS     = counter("llm_tokens_total", "Upstream tokens by direction.", ["model", "direction"])
+LLM_TOKEN_RATE = histogram("llm_output_tokens_per_second", "Output tokens per second per upstream call.", ["model"], RATE_BUCKETS)
+LLM_ERRORS     = counter("llm_errors_total", "Failed upstream calls.", ["model", "kind"])
+LLM_CONTEXT_MODE = counter("llm_context_mode_total", "Chat turns by how context went upstream: chained, full or fallback (broken chain).", ["mode"])
+LLM_COALESCED  = counter("llm_coalesced_total", "Requests served by an identical in-flight upstream call.", ["kind"])
+LLM_UPSTREAM_PATH = counter("llm_upstream_path_total", "Upstream calls by the path that served them: primary, retry, hedge, fallback or failed.", ["kind", "path"])
+LLM_HEDGES     = counter("llm_hedges_total", "Hedged duplicate attempts by whether the duplicate won.", ["kind", "outcome"])
+LLM_CIRCUIT_OPEN = gauge("llm_circuit_open", "1 while the model's circuit breaker is open.", ["model"])
+
+SUMMARY_RUNS     = counter("summarization_runs_total", "Background summarizations by outcome.", ["outcome"])
+SUMMARY_LATENCY  = histogram("summarization_duration_seconds", "Background summarization duration.")
+COMPETITOR_CHECK = histogram("competitor_check_duration_seconds", "Competitor keyword check duration.", buckets=FAST_BUCKETS)
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+def record_llm(model: str, kind: str, seconds: float, ttft: Optional[float] = None,
+               input_tokens: int = 0, output_tokens: int = 0) -> None:
+    m = model_label(model)
+    LLM_LATENCY.child(m, kind).observe(seconds)
+    if ttft is not None:
+        LLM_TTFT.child(m, kind).observe(ttft)
+    if input_tokens:
+        LLM_TOKENS.child(m, "input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS.child(m, "output").inc(output_tokens)
+        gen = seconds - (ttft or 0.0)
+        if gen > 0:
+            LLM_TOKEN_RATE.child(m).observe(output_tokens / gen)
+
+def record_usage(model: str, kind: str, started: float, usage: Any, ttft: Optional[float] = None) -> None:
+    """record_llm() from an OpenAI usage object (Responses or Chat Completions)."""
+    inp = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", 0) or 0
+    out = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", 0) or 0
+    record_llm(model, kind, time.perf_counter() - started, ttft, inp, out)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency, status classes and in-flight
+    requests. Metrics are resolved once per route template and method."""
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = HTTP_IN_FLIGHT.child()
+        self._routes: Dict[str, Dict[str, Tuple[Histogram, Dict[str, Counter]]]] = {}
+
+    def _children(self, path: str, method: str) -> Tuple[Histogram, Dict[str, Counter]]:
+        by_method = self._routes.get(path)
+        if by_method is None:
+            by_method = self._routes[path] = {}
+        found = by_method.get(method)
+        if found is None:
+            found = by_method[method] = (
+                HTTP_LATENCY.child(path, method),
+                {c: HTTP_REQUESTS.child(path, method, c) for c in STATUS_CLASSES},
+            )
+        return found
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        self._in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._in_flight.dec()
+            route = scope.get("route")
+            hist, by_status = self._children(route.path if route is not None else "unmatched", scope["method"])
+            hist.observe(time.perf_counter() - start)
+            by_status[STATUS_CLASSES[min(max(status[0] // 100, 1), 5) - 1]].inc()
+
+
+router = APIRouter(prefix="", tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,126 @@
+import os, re, time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+from metrics import KNOWN_MODELS, counter, histogram, model_label
+
+# Opt-in routing of /chat turns to a model tier when the client does not
+# name a model. A cheap local classifier looks at the message (length,
+# intent keywords) and the session (how much context is carried) and picks
+# the model and max_output_tokens. Every decision is logged with its
+# latency outcome so the thresholds can be tuned with bench/router_bench.py.
+MODEL_ROUTER             = os.getenv("MODEL_ROUTER", "0").lower() in ("1", "true", "yes")
+DEFAULT_MODEL            = os.getenv("DEFAULT_MODEL", "gpt-4o")
+DEFAULT_MAX_TOKENS       = int(os.getenv("DEFAULT_MAX_TOKENS", "3000"))
+ROUTER_LIGHT_MODEL       = os.getenv("ROUTER_LIGHT_MODEL", "gpt-4o-mini")
+ROUTER_FULL_MODEL        = os.getenv("ROUTER_FULL_MODEL", DEFAULT_MODEL)
+KNOWN_MODELS.update((DEFAULT_MODEL, ROUTER_LIGHT_MODEL, ROUTER_FULL_MODEL))   # configured, so labelled and tracked
+ROUTER_BRIEF_MAX_TOKENS  = int(os.getenv("ROUTER_BRIEF_MAX_TOKENS", "200"))
+ROUTER_LIGHT_MAX_TOKENS  = int(os.getenv("ROUTER_LIGHT_MAX_TOKENS", "800"))
+ROUTER_FULL_MAX_TOKENS   = int(os.getenv("ROUTER_FULL_MAX_TOKENS", str(DEFAULT_MAX_TOKENS)))
+ROUTER_BRIEF_WORDS       = int(os.getenv("ROUTER_BRIEF_WORDS", "6"))
+ROUTER_LIGHT_WORDS       = int(os.getenv("ROUTER_LIGHT_WORDS", "25"))
+ROUTER_LONG_CONTEXT      = int(os.getenv("ROUTER_LONG_CONTEXT", "6000"))   # chars of history and summary
+ROUTER_LOG_SIZE          = int(os.getenv("ROUTER_LOG_SIZE", "1000"))
+
+# acknowledgements and small talk
+BRIEF_RE = re.compile(
+    r"(?:(?:hi|hello|hey|thanks?(?: you)?(?: so much| a lot)?|thx|ty|ok(?:ay)?|cool|great|perfect|nice|got it|"
+    r"bye|goodbye|see you|yes|no|sure|awesome|cheers|merci|gracias|danke|tesekkurler|teşekkürler)\b[\s,!.?]*)+",
+    re.IGNORECASE,
+)
+# requests that involve planning, comparing or the tools behind the agent
+COMPLEX_RE = re.compile(
+    r"\b(plan|planning|itinerary|itineraries|schedule|compare|comparison|versus|vs|recommend|"
+    r"explain|why|how do|step by step|budget|route|days?|weeks?|visa|multi|several|pros|cons|"
+    r"translate|translations?|events?)\b",
+    re.IGNORECASE,
+)
+
+ROUTER_DECISIONS = counter("router_decisions_total", "Model router decisions by tier and reason.", ["tier", "reason"])
+ROUTER_LATENCY   = histogram("router_turn_duration_seconds", "Chat turn duration by routed tier.", ["tier", "model"])
+
+
+class Route(NamedTuple):
+    model: str
+    max_output_tokens: int
+    tier: str      # brief | light | full, or client | default when the router did not choose
+    reason: str
+
+
+class Features(NamedTuple):
+    words: int
+    brief: bool
+    complex: bool
+    context_chars: int
+
+
+def features(message: str, context_chars: int) -> Features:
+    text = message.strip()
+    return Features(len(text.split()), bool(BRIEF_RE.fullmatch(text)), bool(COMPLEX_RE.search(text)), context_chars)
+
+
+def classify(f: Features) -> Route:
+    if f.context_chars > ROUTER_LONG_CONTEXT:
+        return Route(ROUTER_FULL_MODEL, ROUTER_FULL_MAX_TOKENS, "full", "long_context")
+    if f.complex:
+        return Route(ROUTER_FULL_MODEL, ROUTER_FULL_MAX_TOKENS, "full", "intent")
+    if f.brief and f.words <= ROUTER_BRIEF_WORDS:
+        return Route(ROUTER_LIGHT_MODEL, ROUTER_BRIEF_MAX_TOKENS, "brief", "acknowledgement")
+    if f.words <= ROUTER_LIGHT_WORDS:
+        return Route(ROUTER_LIGHT_MODEL, ROUTER_LIGHT_MAX_TOKENS, "light", "short")
+    return Route(ROUTER_FULL_MODEL, ROUTER_FULL_MAX_TOKENS, "full", "long_message")
+
+
+class ModelRouter:
+    def __init__(self, enabled: bool = MODEL_ROUTER, log_size: int = ROUTER_LOG_SIZE):
+        self.enabled = enabled
+        self.log: Deque[Dict[str, Any]] = deque(maxlen=log_size)
+
+    def route(self, message: str, context_chars: int, model: Optional[str] = None,
+              max_output_tokens: Optional[int] = None) -> Route:
+        """The client's model, if it named one, wins; its max_output_tokens
+        likewise overrides the tier's."""
+        if model:
+            r = Route(model, max_output_tokens or DEFAULT_MAX_TOKENS, "client", "explicit")
+        elif not self.enabled:
+            r = Route(DEFAULT_MODEL, max_output_tokens or DEFAULT_MAX_TOKENS, "default", "router_off")
+        else:
+            r = classify(features(message, context_chars))
+            if max_output_tokens:
+                r = r._replace(max_output_tokens=max_output_tokens)
+        ROUTER_DECISIONS.child(r.tier, r.reason).inc()
+        return r
+
+    def record(self, route: Route, message: str, context_chars: int, seconds: float, ok: bool) -> None:
+        ROUTER_LATENCY.child(route.tier, model_label(route.model)).observe(seconds)
+        self.log.append({**route._asdict(), **features(message, context_chars)._asdict(),
+                         "seconds": round(seconds, 4), "ok": ok, "at": time.time()})
+
+    async def observe(self, route: Route, message: str, context_chars: int, started: float, body):
+        """Wrap a streamed body and record the turn once it ends."""
+        ok = False
+        try:
+            async for chunk in body:
+                yield chunk
+            ok = True
+        finally:
+            self.record(route, message, context_chars, time.perf_counter() - started, ok)
+
+    def decisions(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return list(self.log)[-limit:] if limit > 0 else []
+
+    def stats(self) -> Dict[str, Any]:
+        by_tier: Dict[str, List[float]] = {}
+        for d in list(self.log):   # /metrics reads this from the threadpool
+            by_tier.setdefault(d["tier"], []).append(d["seconds"])
+        out: Dict[str, Any] = {"enabled": self.enabled, "logged": len(self.log)}
+        for tier, secs in by_tier.items():
+            secs.sort()
+            out[f"{tier}_turns"] = len(secs)
+            out[f"{tier}_p50_s"] = secs[len(secs) // 2]
+            out[f"{tier}_p95_s"] = secs[min(int(len(secs) * 0.95), len(secs) - 1)]
+        return out
+
+
+ROUTER = ModelRouter()
@@ -0,0 +1,297 @@
+import os, sys, hmac, html, json, time, zlib, threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+
+from metrics import counter, register_stats
+
+# Admin-only profiling, two parts:
+#   - slow-request capture: every request carries a Timings object through a
+#     context variable; code marks its phases (parse, admission, guard,
+#     context, upstream, commit, serialize) and requests slower than
+#     SLOW_REQUEST_SECONDS are kept with their breakdown in a ring buffer;
+#   - a sampling profiler: for a bounded window a thread samples the event
+#     loop's stack every PROFILE_INTERVAL seconds and counts collapsed stacks,
+#     exported as text (flamegraph.pl, speedscope) or as an SVG flame graph.
+#     Time the loop spends idle in select() is time spent waiting on I/O.
+# The /admin endpoints answer 404 unless ADMIN_TOKEN is set, and then expect
+# it in the X-Admin-Token header.
+ADMIN_TOKEN           = os.getenv("ADMIN_TOKEN", "")
+SLOW_REQUEST_SECONDS  = float(os.getenv("SLOW_REQUEST_SECONDS", "2"))   # 0 disables capture
+SLOW_REQUEST_LOG_SIZE = int(os.getenv("SLOW_REQUEST_LOG_SIZE", "200"))
+PROFILE_INTERVAL      = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS   = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+PROFILE_MAX_DEPTH     = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+
+SLOW_REQUESTS_TOTAL = counter("slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.", ["route"])
+
+
+# --- Per-phase timings ---
+class Timings:
+    __slots__ = ("started", "mark_at", "phases")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.mark_at = started
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+TIMINGS: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+class phase:
+    """`with phase("upstream"): ...` adds the block's duration to the current
+    request's timings. Repeated phases add up; outside a request it is a no-op."""
+
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = TIMINGS.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.started)
+
+def mark(name: str) -> None:
+    """Record the time since the request started, or since the last mark,
+    as `name`; called on handler entry it measures body parsing and validation."""
+    t = TIMINGS.get()
+    if t is not None:
+        now = time.perf_counter()
+        t.add(name, now - t.mark_at)
+        t.mark_at = now
+
+
+class SlowRequestLog:
+    def __init__(self, threshold: float = SLOW_REQUEST_SECONDS, size: int = SLOW_REQUEST_LOG_SIZE):
+        self.threshold = threshold
+        self.log: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.captured = 0
+
+    def record(self, method: str, route: str, path: str, status: int, timings: Timings, seconds: float) -> None:
+        phases = {k: round(v, 6) for k, v in timings.phases.items()}
+        self.captured += 1
+        SLOW_REQUESTS_TOTAL.child(route).inc()
+        self.log.append({"at": time.time(), "method": method, "route": route, "path": path, "status": status,
+                         "seconds": round(seconds, 6), "phases": phases,
+                         "other": round(max(seconds - sum(timings.phases.values()), 0.0), 6)})
+
+    def entries(self, limit: int = 50, route: Optional[str] = None) -> List[Dict[str, Any]]:
+        out = [e for e in list(self.log) if route is None or e["route"] == route]
+        return out[-limit:][::-1] if limit > 0 else []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"threshold_s": self.threshold, "captured": self.captured, "logged": len(self.log)}
+
+
+SLOW_REQUESTS = SlowRequestLog()
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware: gives each HTTP request its Timings and logs it
+    when it ends (streamed bodies included) slower than the threshold."""
+
+    def __init__(self, app, log: SlowRequestLog = SLOW_REQUESTS):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.log.threshold <= 0:
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        timings = Timings(time.perf_counter())
+        token = TIMINGS.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            TIMINGS.reset(token)
+            seconds = time.perf_counter() - timings.started
+            if seconds >= self.log.threshold:
+                route = scope.get("route")
+                self.log.record(scope["method"], route.path if route is not None else "unmatched",
+                                scope["path"], status[0], timings, seconds)
+
+
+# --- Sampling profiler ---
+_LABELS: Dict[Any, str] = {}
+
+def _label(code) -> str:
+    label = _LABELS.get(code)
+    if label is None:
+        label = _LABELS[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":").replace(" ", "_")
+    return label
+
+def collapse(frame, depth: int = PROFILE_MAX_DEPTH) -> str:
+    names: List[str] = []
+    while frame is not None and len(names) < depth:
+        names.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Samples one thread's stack (the event loop's) from a background thread.
+    One profile at a time; its counts stay readable until the next start."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.interval = PROFILE_INTERVAL
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float, thread_id: Optional[int] = None) -> None:
+        if self.running:
+            raise RuntimeError("profiler already running")
+        self.counts = Counter()
+        self.samples = 0
+        self.interval = interval
+        self.started, self.ended = time.time(), None
+        self._stop.clear()
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target, time.monotonic() + seconds),
+                                        name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, thread_id: int, deadline: float) -> None:
+        try:
+            while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    break
+                stack = collapse(frame)
+                del frame
+                with self._lock:
+                    self.counts[stack] += 1
+                    self.samples += 1
+        finally:
+            self.ended = time.time()
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return self.counts.copy()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.snapshot().most_common())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "samples": self.samples, "stacks": len(self.counts),
+                "interval_s": self.interval, "started": self.started, "ended": self.ended}
+
+
+SAMPLER = Sampler()
+register_stats("profiler", "Sampling profiler", lambda: {"running": int(SAMPLER.running), "samples": SAMPLER.samples})
+register_stats("slow_requests", "Slow request capture", SLOW_REQUESTS.stats)
+
+
+def flamegraph(counts: Counter, title: str = "", width: int = 1200, row: int = 16) -> str:
+    """A self-contained SVG flame graph of collapsed stack counts."""
+    root: Dict[str, Any] = {}
+    total = 0
+    for stack, n in counts.items():
+        total += n
+        node = root
+        for name in stack.split(";"):
+            entry = node.setdefault(name, [0, {}])
+            entry[0] += n
+            node = entry[1]
+
+    rects: List[tuple] = []
+
+    def walk(children: Dict[str, Any], x: float, depth: int) -> None:
+        for name, (n, kids) in sorted(children.items()):
+            w = n / total * width
+            if w >= 0.5:
+                rects.append((x, depth, w, name, n))
+                walk(kids, x, depth + 1)
+            x += w
+
+    if total:
+        walk(root, 0.0, 0)
+    top = 24
+    height = top + (max((r[1] for r in rects), default=0) + 1) * row
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+           f'<text x="4" y="16">{html.escape(title)} ({total} samples)</text>']
+    for x, depth, w, name, n in rects:
+        y = height - (depth + 1) * row
+        hue = zlib.crc32(name.encode()) % 50
+        fits = int(w / 7)   # characters that fit at font-size 11
+        label = html.escape(name if len(name) <= fits else name[:fits - 2] + ".." if fits > 4 else "")
+        out.append(f'<g><title>{html.escape(name)} ({n} samples, {n / total:.1%})</title>'
+                   f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>'
+                   f'<text x="{x + 3:.1f}" y="{y + row - 4}">{label}</text></g>')
+    out.append("</svg>")
+    return "\n".join(out)
+
+
+# --- Admin endpoints ---
+def require_admin(x_admin_token: str = Header("")) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(403, "Forbidden")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/slow_requests")
+async def slow_requests(limit: int = 50, route: Optional[str] = None) -> Dict[str, Any]:
+    return {**SLOW_REQUESTS.stats(), "requests": SLOW_REQUESTS.entries(limit, route)}
+
+@router.post("/profile")
+async def start_profile(seconds: float = 30, interval: float = PROFILE_INTERVAL) -> Dict[str, Any]:
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(422, f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+    if interval < 0.001:
+        raise HTTPException(422, "interval must be at least 0.001")
+    try:
+        SAMPLER.start(seconds, interval)   # this handler runs on the event loop's thread
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return SAMPLER.stats()
+
+@router.delete("/profile")
+def stop_profile() -> Dict[str, Any]:
+    SAMPLER.stop()
+    return SAMPLER.stats()
+
+@router.get("/profile")
+def get_profile(format: str = "collapsed") -> Response:
+    if format == "collapsed":
+        return PlainTextResponse(SAMPLER.collapsed())
+    if format == "svg":
+        return Response(flamegraph(SAMPLER.snapshot(), "event loop"), media_type="image/svg+xml")
+    if format == "json":
+        return Response(json.dumps({**SAMPLER.stats(), "top": SAMPLER.snapshot().most_common(50)}),
+                        media_type="application/json")
+    raise HTTPException(422, "format must be collapsed, svg or json")
@@ -0,0 +1,271 @@
+import os, sys, time, random, asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+from llm import UpstreamLimiter, get_client, limiter as llm_limiter
+from metrics import KNOWN_MODELS, LLM_CIRCUIT_OPEN, LLM_ERRORS, LLM_HEDGES, LLM_UPSTREAM_PATH, model_label
+
+# Resilience around the chat calls to the Responses API. Every attempt gets
+# its own timeout; retryable failures (timeouts, connection errors, 408/409/
+# 429/5xx) are retried with jittered exponential backoff. Each attempt holds
+# an upstream limiter slot; its latency is measured from when it got one.
+# With LLM_HEDGE=1, an attempt still running at the LLM_HEDGE_PERCENTILE
+# latency of recent calls gets a duplicate, unless calls are queueing for
+# the limiter, and the first answer wins. A model that keeps failing has its
+# circuit opened and is routed to LLM_FALLBACK_MODEL until a probe succeeds.
+# Breakers and latency windows are kept for configured models only (see
+# METRICS_MODELS): other names come from clients and are neither hedged nor
+# circuit-broken.
+LLM_ATTEMPT_TIMEOUT     = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60"))
+LLM_RETRIES             = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE          = float(os.getenv("LLM_RETRY_BASE", "0.25"))
+LLM_RETRY_MAX           = float(os.getenv("LLM_RETRY_MAX", "4"))
+LLM_HEDGE               = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE    = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES   = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY     = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_LATENCY_WINDOW      = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+LLM_FALLBACK_MODEL      = os.getenv("LLM_FALLBACK_MODEL", "gpt-4o-mini")   # empty disables fallback
+LLM_BREAKER_FAILURES    = int(os.getenv("LLM_BREAKER_FAILURES", "5"))      # consecutive, to open
+LLM_BREAKER_COOLDOWN    = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class Served(NamedTuple):
+    """Which path answered: primary, retry, hedge or fallback, and the model."""
+    path: str
+    model: str
+
+    def headers(self) -> Dict[str, str]:
+        return {"X-Upstream-Path": self.path, "X-Upstream-Model": self.model}
+
+
+def retryable(e: BaseException) -> bool:
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    if isinstance(e, HTTPException):  # our own limiter shedding load
+        return False
+    import openai  # already loaded once a client exists
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+def retry_after(e: BaseException) -> float:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+class LatencyWindow:
+    """Recent successful attempt latencies of one model and call kind."""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; after `cooldown` one probe
+    is let through (half-open) and its outcome closes or re-opens it."""
+
+    def __init__(self, model: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.model = model
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0) if self.opened_at else 0.0
+
+    def success(self) -> None:
+        self.consecutive = 0
+        self.probing = False
+        if self.opened_at is not None:
+            self.opened_at = None
+            LLM_CIRCUIT_OPEN.child(model_label(self.model)).set(0)
+
+    def failure(self) -> None:
+        self.consecutive += 1
+        if self.probing or (self.opened_at is None and self.consecutive >= self.failures):
+            self.opened_at = time.monotonic()
+            self.opens += 1
+            LLM_CIRCUIT_OPEN.child(model_label(self.model)).set(1)
+        self.probing = False
+
+
+# shared by every unconfigured model; it never opens
+UNTRACKED = CircuitBreaker("other", failures=sys.maxsize)
+
+
+class Upstream:
+    def __init__(self, timeout: float = LLM_ATTEMPT_TIMEOUT, retries: int = LLM_RETRIES,
+                 hedge: bool = LLM_HEDGE, fallback: str = LLM_FALLBACK_MODEL,
+                 limiter: UpstreamLimiter = llm_limiter):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.retries = retries
+        self.hedge = hedge
+        self.fallback = fallback
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latency: Dict[Tuple[str, str], LatencyWindow] = {}
+
+    def client(self):
+        """The shared client without the SDK's own retries; they happen here."""
+        return get_client(retries=False)
+
+    def tracked(self, model: str) -> bool:
+        return model in KNOWN_MODELS or model == self.fallback
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if not self.tracked(model):
+            return UNTRACKED
+        b = self.breakers.get(model)
+        if b is None:
+            b = self.breakers[model] = CircuitBreaker(model)
+        return b
+
+    def _window(self, model: str, kind: str) -> Optional[LatencyWindow]:
+        if not self.tracked(model):
+            return None
+        w = self.latency.get((model, kind))
+        if w is None:
+            w = self.latency[(model, kind)] = LatencyWindow()
+        return w
+
+    def hedge_delay(self, model: str, kind: str) -> Optional[float]:
+        w = self._window(model, kind)
+        if not self.hedge or w is None or len(w.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(w.percentile(LLM_HEDGE_PERCENTILE), LLM_HEDGE_MIN_DELAY)
+
+    async def call(self, kind: str, model: str, attempt: Callable[[str], Awaitable[Any]],
+                   discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+                   hold: bool = False) -> Tuple[Any, Served]:
+        """attempt(model) with retries, hedging and fallback. With `hold` the
+        result keeps its limiter slot (a stream releases it once closed).
+        `discard` cleans up the result of a hedged attempt that lost the race,
+        releasing its slot too when held."""
+        fallback = self.fallback if self.fallback and self.fallback != model else None
+        plan = [model] * (self.retries + 1) + ([fallback] if fallback else [])
+        last: Optional[BaseException] = None
+        for n, m in enumerate(plan):
+            if m == model and not self.breaker(model).allow():
+                if fallback is None:
+                    raise HTTPException(503, "Upstream model is unavailable",
+                                        headers={"Retry-After": str(max(1, round(self.breaker(model).retry_in())))})
+                m = fallback
+            if n:
+                delay = min(LLM_RETRY_BASE * 2 ** (n - 1), LLM_RETRY_MAX)
+                await asyncio.sleep(max(random.uniform(0, delay), min(retry_after(last), LLM_RETRY_MAX)))
+            try:
+                result, hedged = await self._attempt(kind, m, attempt, discard, hold)
+            except BaseException as e:
+                if not isinstance(e, Exception) or not retryable(e):
+                    self.breaker(m).probing = False  # says nothing about the model's health
+                    raise
+                LLM_ERRORS.child(model_label(m), kind).inc()
+                self.breaker(m).failure()
+                last = e
+                continue
+            self.breaker(m).success()
+            path = "fallback" if m != model else "hedge" if hedged else "retry" if n else "primary"
+            LLM_UPSTREAM_PATH.child(kind, path).inc()
+            return result, Served(path, m)
+        LLM_UPSTREAM_PATH.child(kind, "failed").inc()
+        if isinstance(last, asyncio.TimeoutError):
+            raise HTTPException(504, "Upstream model timed out", headers={"Retry-After": "1"})
+        raise HTTPException(502, f"Upstream model unavailable: {last}", headers={"Retry-After": "1"})
+
+    async def _attempt(self, kind: str, model: str, attempt, discard, hold: bool) -> Tuple[Any, bool]:
+        """One attempt, plus a hedged duplicate if it runs past the hedge delay.
+        Returns (result, whether the duplicate won)."""
+        async def timed():
+            await self.limiter.acquire()   # local queueing is not upstream latency
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(attempt(model), self.timeout)
+            except BaseException:
+                self.limiter.release()
+                raise
+            if not hold:
+                self.limiter.release()
+            return result, time.perf_counter() - started
+
+        tasks: List[asyncio.Task] = [asyncio.ensure_future(timed())]
+        try:
+            delay = self.hedge_delay(model, kind)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                # a duplicate would only queue behind calls already waiting
+                if not done and not self.limiter.waiting:
+                    tasks.append(asyncio.ensure_future(timed()))
+            pending = list(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in tasks:
+                    if t in done and t.exception() is None:
+                        result, seconds = t.result()
+                        w = self._window(model, kind)
+                        if w is not None:
+                            w.add(seconds)
+                        hedged = t is not tasks[0]
+                        if len(tasks) > 1:
+                            LLM_HEDGES.child(kind, "won" if hedged else "lost").inc()
+                        tasks.remove(t)
+                        return result, hedged
+                for t in done:
+                    pending.remove(t)
+                    error = error or t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+                if discard is not None:
+                    t.add_done_callback(lambda t: _discard(t, discard))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breakers_open": sum(b.state != "closed" for b in self.breakers.values()),
+            "breaker_opens": sum(b.opens for b in self.breakers.values()),
+        }
+
+
+def _discard(task: asyncio.Task, discard) -> None:
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()[0]))
+
+
+UPSTREAM = Upstream()
@@ -0,0 +1,157 @@
+import os, json, time, asyncio
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from llm import get_client, limiter
+from metrics import record_usage
+from routes_chat import commit_turn, frame, load_context
+from admission import ADMISSION_CONTROL, client_id
+
+router = APIRouter(prefix="", tags=["agent"])
+
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "5"))
+
+class AgentReq(BaseModel):
+    session_id: str
+    message: str
+    model: str = "gpt-4o"
+    max_output_tokens: int = 3000
+    max_iterations: int = Field(default=AGENT_MAX_ITERATIONS, ge=1, le=AGENT_MAX_ITERATIONS)
+    format: Literal["text", "sse"] = "text"
+
+_schemas: Optional[List[Dict[str, Any]]] = None
+
+def _tools():
+    # main imports this module, so the registry is looked up lazily
+    import main
+    global _schemas
+    if _schemas is None:
+        _schemas = main.tool_schemas()
+    return main, _schemas
+
+
+async def _call_tool(call: Dict[str, str]) -> str:
+    main, _ = _tools()
+    try:
+        args = json.loads(call["arguments"] or "{}")
+        return (await main.invoke_tool(call["name"], args)).decode()
+    except json.JSONDecodeError as e:
+        return json.dumps({"ok": False, "error": {"type": "invalid_arguments", "detail": str(e)}})
+    except Exception as e:
+        return json.dumps({"ok": False, "error": main.tool_error(e)})
+
+
+async def _turn(req: AgentReq, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]], out: List[str]):
+    """One streamed model call: yields content deltas (also collected in
+    `out`) and appends the assistant message, with any tool calls, to
+    `messages`."""
+    calls: Dict[int, Dict[str, str]] = {}
+    kwargs: Dict[str, Any] = {"tools": tools} if tools else {}
+    ttft = usage = None
+    async with limiter:
+        started = time.perf_counter()
+        stream = await get_client().chat.completions.create(
+            model=req.model,
+            messages=messages,
+            max_tokens=req.max_output_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if ttft is None and (delta.content or delta.tool_calls):
+                    ttft = time.perf_counter() - started
+                if delta.content:
+                    out.append(delta.content)
+                    yield delta.content
+                for tc in delta.tool_calls or ():
+                    slot = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+                    if tc.id:
+                        slot["id"] = tc.id
+                    if tc.function is not None:
+                        slot["name"] += tc.function.name or ""
+                        slot["arguments"] += tc.function.arguments or ""
+    record_usage(req.model, "agent", started, usage, ttft)
+    messages.append({
+        "role": "assistant",
+        "content": "".join(out) or None,
+        **({"tool_calls": [
+            {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+            for _, c in sorted(calls.items())
+        ]} if calls else {}),
+    })
+
+
+async def _run(req: AgentReq, messages: List[Dict[str, Any]]):
+    _, schemas = _tools()
+    # everything streamed, including content from passes that went on to
+    # call tools, so the committed answer is the transcript the client saw
+    text: List[str] = []
+    try:
+        for i in range(req.max_iterations + 1):
+            # the last pass runs without tools so the model has to answer
+            tools = schemas if i < req.max_iterations else None
+            part: List[str] = []
+            async for delta in _turn(req, messages, tools, part):
+                if text and len(part) == 1:   # first content after an earlier pass's
+                    text.append("\n\n")
+                    yield frame("delta", "\n\n", req.format)
+                yield frame("delta", delta, req.format)
+            text.extend(part)
+
+            calls = messages[-1].get("tool_calls")
+            if not calls:
+                break
+            for c in calls:
+                yield frame("tool", c["function"]["name"], req.format)
+            # every tool call of the turn runs in parallel, in-process
+            outputs = await asyncio.gather(*(
+                _call_tool({"name": c["function"]["name"], "arguments": c["function"]["arguments"]})
+                for c in calls
+            ))
+            messages.extend(
+                {"role": "tool", "tool_call_id": c["id"], "content": o} for c, o in zip(calls, outputs)
+            )
+    except HTTPException as e:
+        yield frame("error", str(e.detail), req.format)
+        return
+    except Exception as e:
+        yield frame("error", f"AI error: {e}", req.format)
+        return
+
+    answer = "".join(text).strip()
+    if not answer:
+        yield frame("error", "Empty response from model", req.format)
+        return
+    await commit_turn(req.session_id, req.message, answer, req.model)
+    yield frame("done", "", req.format)
+
+
+@router.post("/agent")
+async def agent(req: AgentReq, request: Request):
+    """Runs the model<->tool loop server-side and streams the final answer."""
+    ticket = await ADMISSION_CONTROL.admit(req.session_id, client_id(request))
+    try:
+        messages = await load_context(req.session_id, req.message, req.model)
+    except Exception as e:
+        ticket.release()
+        raise HTTPException(500, f"AI error: {e}")
+    except BaseException:
+        ticket.release()
+        raise
+
+    media_type = "text/event-stream" if req.format == "sse" else "text/plain"
+    return StreamingResponse(
+        ticket.guard(_run(req, list(messages))),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release),
+    )
@@ -1,46 +1,45 @@
-import os, asyncio
-from typing import Dict, List
-from fastapi import APIRouter, HTTPException
+import json, time
+from typing import Any, Dict, List, Literal, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from openai import OpenAI
+from llm import limiter
+from metrics import LLM_CONTEXT_MODE, LLM_ERRORS, model_label, record_usage, register_stats
+from session_store import create_store, session_size
+from context import (build_context, chain_broken, chain_from, chained_input, history_entry,
+                     link_response, schedule_summary)
+from llm_cache import LLM_RESPONSES, cache_key
+from singleflight import FLIGHTS, request_key
+from admission import ADMISSION_CONTROL, client_id
+from resilience import UPSTREAM, Served
+from model_router import ROUTER, Route
+from profiler import mark, phase
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 router = APIRouter(prefix="", tags=["chat"])
 
 
-CONV: Dict[str, List[Dict[str, str]]] = {}
+STORE = create_store()
+register_stats("session_store", "Session store", STORE.stats)
+register_stats("singleflight", "Coalesced upstream requests", FLIGHTS.stats)
+if LLM_RESPONSES is not None:
+    register_stats("llm_cache", "LLM response cache", LLM_RESPONSES.stats)
+register_stats("model_router", "Model router", ROUTER.stats)
 
 class ChatReq(BaseModel):
     session_id: str            
     message: str               
     stream: bool = True        
-    model: str = "gpt-4o"      
-    max_output_tokens: int = 3000
+    model: Optional[str] = None             # None: DEFAULT_MODEL, or the router's pick when enabled
+    max_output_tokens: Optional[int] = None
+    format: Literal["text", "sse"] = "text"
 
-async def _aiter_text(s: str):
-    for ch in s:
-        yield ch
-        await asyncio.sleep(0)  
-
-def _needs_summarize(history: List[Dict[str,str]]) -> bool:
-
-    return len(history) > 20
-
-def _summarize(history: List[Dict[str,str]]) -> str:
-    text = "\n".join(f"{m['role']}: {m['content']}" for m in history)
-
-    rsp = client.responses.create(
-        model="gpt-4o-mini",
-        input=f"Summarize briefly (<=200 words) preserving key facts and decisions:\n\n{text}"
-    )
-
-    parts = []
-    for item in rsp.output or []:
-        for c in getattr(item, "content", []) or []:
-            if getattr(c, "type", "") == "output_text":
-                parts.append(c.get("text", ""))  
-    return "".join(parts) or "Conversation so far: (summary unavailable)."
+class Turn(NamedTuple):
+    req: ChatReq               # with model and max_output_tokens resolved
+    route: Route
+    context_chars: int
+    messages: List[Dict[str, str]]     # local context: summary, recent turns, new message
+    chain: Optional[str]               # previous_response_id, when the turn can be chained
 
 def _response_text(resp) -> str:
 
@@ -48,43 +47,332 @@ def _response_text(resp) -> str:
     for item in resp.output or []:
         for c in getattr(item, "content", []) or []:
             if getattr(c, "type", "") == "output_text":
-                buf.append(c.get("text", ""))  # type: ignore
+                buf.append(getattr(c, "text", ""))
     return "".join(buf).strip()
 
+async def load_context(sid: str, message: str, model: str) -> List[Dict[str, str]]:
+    session = await STORE.load(sid)
+    return build_context(session, message, model)
+
+async def prepare_turn(req: ChatReq) -> Turn:
+    session = await STORE.load(req.session_id)
+    chars = session_size(session)
+    route = ROUTER.route(req.message, chars, req.model, req.max_output_tokens)
+    req = req.model_copy(update={"model": route.model, "max_output_tokens": route.max_output_tokens})
+    return Turn(req, route, chars, build_context(session, req.message, req.model),
+                chain_from(session, req.message, req.model))
+
+async def commit_turn(sid: str, message: str, text: str, model: str, response: Any = None) -> None:
+    session = await STORE.load(sid)
+    session["messages"].append(history_entry("user", message, model))
+    session["messages"].append(history_entry("assistant", text, model))
+    link_response(session, response)
+    await STORE.save(sid, session)
+    schedule_summary(STORE, sid, session, model)
+
+def _chain_args(previous: Optional[str]) -> Dict[str, Any]:
+    return {"previous_response_id": previous} if previous else {}
+
+async def _create(model: str, messages: List[Dict[str, str]], max_output_tokens: int,
+                  previous: Optional[str] = None):
+    async def attempt(m: str):
+        started = time.perf_counter()
+        resp = await UPSTREAM.client().responses.create(
+            model=m,
+            input=messages,
+            max_output_tokens=max_output_tokens,
+            **_chain_args(previous),
+        )
+        record_usage(m, "chat", started, resp.usage)
+        return resp
+    return await UPSTREAM.call("chat", model, attempt)
+
+async def _with_context(turn: Turn, chained, full):
+    """chained() when the turn continues a stored response, falling back to
+    full() (the local context) when there is none or it has gone away."""
+    if turn.chain:
+        try:
+            out = await chained()
+            LLM_CONTEXT_MODE.child("chained").inc()
+            return out
+        except Exception as e:
+            if not chain_broken(e):
+                raise
+            LLM_CONTEXT_MODE.child("fallback").inc()
+    else:
+        LLM_CONTEXT_MODE.child("full").inc()
+    return await full()
+
+def _complete(turn: Turn):
+    req = turn.req
+    return _with_context(
+        turn,
+        lambda: FLIGHTS.do(
+            request_key("chat", req.model, req.max_output_tokens, turn.chain, req.message), "chat",
+            lambda: _create(req.model, chained_input(req.message), req.max_output_tokens, turn.chain)),
+        lambda: FLIGHTS.do(
+            request_key("chat", req.model, req.max_output_tokens, turn.messages), "chat",
+            lambda: _create(req.model, turn.messages, req.max_output_tokens)),
+    )
+
+def _cache_key(req: ChatReq, messages: List[Dict[str, str]]) -> Optional[str]:
+    if LLM_RESPONSES is None:
+        return None
+    return cache_key(req.model, req.max_output_tokens, messages)
+
 
 @router.post("/chat", response_class=PlainTextResponse)
-def chat(req: ChatReq):
+async def chat(req: ChatReq, request: Request, response: Response):
+    mark("parse")
     sid = req.session_id
-    CONV.setdefault(sid, [])
+    with phase("admission"):
+        ticket = await ADMISSION_CONTROL.admit(sid, client_id(request))
+    async with ticket:
+        return await _chat(req, response)
 
+async def _chat(req: ChatReq, response: Response):
+    sid = req.session_id
+    started = time.perf_counter()
+    turn: Optional[Turn] = None
+    ok = False
+    try:
+        with phase("context"):
+            turn = await prepare_turn(req)
+        req, messages = turn.req, turn.messages
+        response.headers["X-Model-Tier"] = turn.route.tier
+        key = _cache_key(req, messages)
+        text = LLM_RESPONSES.get(key) if key else None
+        resp = None
+        if key:
+            response.headers["X-Cache"] = "HIT" if text else "MISS"
+        if text is None:
+            with phase("upstream"):
+                resp, served = await _complete(turn)
+            response.headers.update(served.headers())
+            text = _response_text(resp)
+            if not text:
+                raise HTTPException(500, "Empty response from model")
+            # a fallback model's answer is not cached under the requested model
+            if key and resp.status == "completed" and served.model == req.model:
+                await LLM_RESPONSES.set(key, text)
 
-    if _needs_summarize(CONV[sid]):
-        summary = _summarize(CONV[sid])
-        CONV[sid] = [{"role": "system", "content": f"Summary so far:\n{summary}"}]
+        with phase("commit"):
+            await commit_turn(sid, req.message, text, req.model, resp)
+        ok = True
+        return text
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        LLM_ERRORS.child(model_label(req.model or ""), "chat").inc()
+        raise HTTPException(500, f"AI error: {e}")
+    finally:
+        if turn is not None:
+            ROUTER.record(turn.route, req.message, turn.context_chars, time.perf_counter() - started, ok)
 
-    messages = CONV[sid] + [{"role": "user", "content": req.message}]
 
-    try:
-        resp = client.responses.create(
-            model=req.model,
-            input=[{"role": m["role"], "content": m["content"]} for m in messages],
-            max_output_tokens=req.max_output_tokens,
+# --- Streaming ---
+def frame(kind: str, data: str, fmt: str) -> str:
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+    return data if kind == "delta" else ""
+
+async def _open_stream(model: str, messages: List[Dict[str, str]], max_output_tokens: int,
+                       previous: Optional[str] = None):
+    # the stream keeps its limiter slot until _observe closes it
+    async def attempt(m: str):
+        return await UPSTREAM.client().responses.create(
+            model=m,
+            input=messages,
+            max_output_tokens=max_output_tokens,
+            stream=True,
+            **_chain_args(previous),
         )
-        text = _response_text(resp)
-        if not text:
-            raise HTTPException(500, "Empty response from model")
 
+    async def discard(stream):
+        # a hedged duplicate that lost the race
+        try:
+            await stream.close()
+        finally:
+            limiter.release()
+
+    started = time.perf_counter()
+    try:
+        stream, served = await UPSTREAM.call("stream", model, attempt, discard, hold=True)
+    except HTTPException:
+        raise
+    except Exception:
+        LLM_ERRORS.child(model_label(model), "stream").inc()
+        raise
+    return _observe(stream, served, started)
+
+async def _observe(stream, served: Served, started: float):
+    # The upstream side of a (possibly shared) stream: metrics are recorded
+    # here once, not per subscriber. The first event says which path served
+    # it, for the response headers.
+    model = served.model
+    ttft = usage = None
+    failed = False
+    try:
+        yield served
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+            elif event.type == "response.completed":
+                usage = event.response.usage
+            elif event.type in ("response.failed", "error"):
+                failed = True
+            yield event
+    except Exception:
+        failed = True
+        raise
+    finally:
+        try:
+            if failed:
+                LLM_ERRORS.child(model_label(model), "stream").inc()
+            elif usage is not None:
+                record_usage(model, "stream", started, usage, ttft)
+            await stream.close()
+        finally:
+            limiter.release()
+
+async def _relay(sid: str, message: str, model: str, events, key: Optional[str] = None):
+    # Yields (kind, data) pairs: "delta"s as they arrive, then "done", or an
+    # "error" that ends the turn. History is only committed once the upstream
+    # stream completes. If the client goes away the generator is closed and
+    # unsubscribes; the upstream response is closed and the limiter slot
+    # freed once no subscriber is left.
+    buf: List[str] = []
+    completed = None
+    try:
+        with phase("upstream"):   # includes the time the client takes to read
+            async for event in events:
+                if event.type == "response.output_text.delta":
+                    buf.append(event.delta)
+                    yield "delta", event.delta
+                elif event.type == "response.completed":
+                    completed = event.response
+                elif event.type in ("response.failed", "error"):
+                    yield "error", "AI error: upstream stream failed"
+                    return
+    except Exception:
+        yield "error", "AI error: upstream stream failed"
+        return
+    finally:
+        await events.aclose()
+
+    text = "".join(buf).strip()
+    if not text:
+        yield "error", "Empty response from model"
+        return
+    if key and completed is not None:
+        await LLM_RESPONSES.set(key, text)
+    with phase("commit"):
+        await commit_turn(sid, message, text, model, completed)
+    yield "done", ""
+
+async def _replay(sid: str, message: str, model: str, text: str):
+    yield "delta", text
+    await commit_turn(sid, message, text, model)
+    yield "done", ""
+
+async def _frames(events, fmt: str):
+    try:
+        async for kind, data in events:
+            yield frame(kind, data, fmt)
+    finally:
+        await events.aclose()
 
-        CONV[sid].append({"role": "user", "content": req.message})
-        CONV[sid].append({"role": "assistant", "content": text})
-        return text
 
+@router.post("/chat_stream")
+async def chat_stream(req: ChatReq, request: Request):
+    # the turn holds its admission slot until the streamed body ends
+    mark("parse")
+    with phase("admission"):
+        ticket = await ADMISSION_CONTROL.admit(req.session_id, client_id(request))
+    try:
+        body, media_type, headers = await _chat_stream(req)
+    except BaseException:
+        ticket.release()
+        raise
+    return StreamingResponse(ticket.guard(body), media_type=media_type, headers=headers,
+                             background=BackgroundTask(ticket.release))
+
+async def _chat_stream(req: ChatReq):
+    started = time.perf_counter()
+    try:
+        with phase("context"):
+            turn = await prepare_turn(req)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"AI error: {e}")
+    body, media_type, headers = await _open_body(turn)
+    headers["X-Model-Tier"] = turn.route.tier
+    return ROUTER.observe(turn.route, req.message, turn.context_chars, started, body), media_type, headers
 
+def _open_events(turn: Turn, share: bool = True):
+    """Upstream events for the turn, led by its Served marker. Shared streams
+    go through singleflight and are read by their own task; unshared ones
+    are read by the caller, so a slow reader pauses the upstream read."""
+    req = turn.req
 
-@router.post("/chat_stream")
-def chat_stream(req: ChatReq):
-    text = chat(req)
-    return StreamingResponse(_aiter_text(text), media_type="text/plain")
+    def source(messages: List[Dict[str, str]], previous: Optional[str] = None):
+        open_source = lambda: _open_stream(req.model, messages, req.max_output_tokens, previous)
+        if not share:
+            return open_source()
+        return FLIGHTS.stream(request_key("stream", req.model, req.max_output_tokens, previous, messages),
+                              "stream", open_source)
+
+    return _with_context(turn, lambda: source(chained_input(req.message), turn.chain),
+                         lambda: source(turn.messages))
+
+async def open_turn(turn: Turn, share: bool = True) -> Tuple[Any, Optional[Served], Optional[str]]:
+    """The turn's reply as (kind, data) events (see _relay), from the cache
+    or from a freshly opened upstream stream. Returns (events, the Served
+    marker or None on a cache hit, the X-Cache value or None)."""
+    req = turn.req
+    key = _cache_key(req, turn.messages)
+    cache = None
+    if key:
+        text = LLM_RESPONSES.get(key)
+        cache = "HIT" if text else "MISS"
+        if text:
+            return _replay(req.session_id, req.message, req.model, text), None, cache
+
+    with phase("upstream"):
+        try:
+            events = await _open_events(turn, share)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"AI error: {e}")
+        try:
+            served: Served = await events.__anext__()
+        except Exception:
+            await events.aclose()
+            raise HTTPException(500, "AI error: upstream stream failed")
+    if served.model != req.model:
+        key = None  # a fallback model's answer is not cached under the requested model
+    return _relay(req.session_id, req.message, req.model, events, key), served, cache
+
+async def _open_body(turn: Turn):
+    req = turn.req
+    media_type = "text/event-stream" if req.format == "sse" else "text/plain"
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    events, served, cache = await open_turn(turn)
+    if cache:
+        headers["X-Cache"] = cache
+    if served is not None:
+        headers.update(served.headers())
+    return _frames(events, req.format), media_type, headers
+
+
+@router.get("/sessions/stats")
+def session_stats() -> Dict[str, Any]:
+    return STORE.stats()
+
+@router.get("/router/decisions")
+async def router_decisions(limit: int = 100) -> Dict[str, Any]:
+    return {"stats": ROUTER.stats(), "decisions": ROUTER.decisions(limit)}
@@ -0,0 +1,191 @@
+import os, time, asyncio
+from typing import Any, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+
+from admission import ADMISSION_CONTROL, client_id
+from metrics import LLM_ERRORS, counter, gauge, model_label
+from model_router import ROUTER
+from routes_chat import ChatReq, open_turn, prepare_turn
+from serialization import dumps
+
+router = APIRouter(prefix="", tags=["chat"])
+
+# /ws/chat?session_id=...: one connection per session carrying successive
+# turns. Client frames (JSON text):
+#   {"type": "message", "message": ..., "model"?: ..., "max_output_tokens"?: ...}
+#   {"type": "cancel"}   stops the turn being generated, nothing is committed
+#   {"type": "ping"} / {"type": "pong"}
+# Server frames: ready, start, delta, done, cancelled, error, ping, pong; turn
+# frames carry the turn number. Each turn goes through admission control like
+# a /chat_stream request. Deltas are sent as they are read from upstream, so a
+# client that reads slowly stalls the send, and with it the upstream read:
+# nothing is buffered beyond the socket. Messages that arrive while a turn runs
+# wait in a queue of WS_MAX_PENDING; beyond that they are rejected.
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+WS_MAX_PENDING     = int(os.getenv("WS_MAX_PENDING", "4"))
+WS_PING_INTERVAL   = float(os.getenv("WS_PING_INTERVAL", "20"))   # 0 disables keepalive
+WS_PING_TIMEOUT    = float(os.getenv("WS_PING_TIMEOUT", "20"))
+WS_MAX_MESSAGE     = int(os.getenv("WS_MAX_MESSAGE", "65536"))    # characters per client frame
+
+CLOSE_TRY_AGAIN = 1013
+CLOSE_PING_TIMEOUT = 4408
+
+WS_CONNECTIONS = gauge("ws_connections", "Open /ws/chat connections.")
+WS_TURNS       = counter("ws_turns_total", "WebSocket chat turns by outcome.", ["outcome"])
+
+
+class WsMessage(BaseModel):
+    type: Literal["message", "cancel", "ping", "pong"]
+    message: Optional[str] = None
+    model: Optional[str] = None
+    max_output_tokens: Optional[int] = None
+
+
+class Connection:
+    def __init__(self, ws: WebSocket, sid: str):
+        self.ws = ws
+        self.sid = sid
+        self.client = client_id(ws)
+        self.pending: "asyncio.Queue[ChatReq]" = asyncio.Queue(WS_MAX_PENDING)
+        self.current: Optional[asyncio.Task] = None
+        self.turns = 0
+        self.seen = time.monotonic()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, kind: str, **fields: Any) -> None:
+        # one writer at a time; a slow client makes every sender wait here
+        async with self._send_lock:
+            await self.ws.send_text(dumps({"type": kind, **fields}).decode())
+
+    async def run(self) -> None:
+        tasks = [asyncio.ensure_future(self._read()), asyncio.ensure_future(self._work())]
+        if WS_PING_INTERVAL > 0:
+            tasks.append(asyncio.ensure_future(self._keepalive()))
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if not t.cancelled() and t.exception() is not None and \
+                        not isinstance(t.exception(), WebSocketDisconnect):
+                    raise t.exception()
+        finally:
+            if self.current is not None:
+                tasks.append(self.current)   # closes its upstream stream and frees its admission slot
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _read(self) -> None:
+        while True:
+            raw = await self.ws.receive_text()
+            self.seen = time.monotonic()
+            if len(raw) > WS_MAX_MESSAGE:
+                await self.send("error", status=413, detail="Message too large")
+                continue
+            try:
+                msg = WsMessage.model_validate_json(raw)
+            except ValidationError:
+                await self.send("error", status=422, detail="Invalid message")
+                continue
+            if msg.type == "ping":
+                await self.send("pong")
+            elif msg.type == "cancel":
+                if self.current is not None and not self.current.done():
+                    self.current.cancel()
+            elif msg.type == "message":
+                if not msg.message:
+                    await self.send("error", status=422, detail="Empty message")
+                    continue
+                try:
+                    self.pending.put_nowait(ChatReq(session_id=self.sid, message=msg.message, model=msg.model,
+                                                    max_output_tokens=msg.max_output_tokens))
+                except asyncio.QueueFull:
+                    await self.send("error", status=429, detail="Too many messages waiting on this connection")
+
+    async def _work(self) -> None:
+        while True:
+            req = await self.pending.get()
+            self.turns += 1
+            n = self.turns
+            self.current = asyncio.ensure_future(self._turn(n, req))
+            await asyncio.wait([self.current])  # our own cancellation propagates, the turn's does not
+            if self.current.cancelled():
+                WS_TURNS.child("cancelled").inc()
+                await self.send("cancelled", turn=n)
+            else:
+                WS_TURNS.child("done" if self.current.result() else "error").inc()
+            self.current = None
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            if time.monotonic() - self.seen > WS_PING_INTERVAL + WS_PING_TIMEOUT:
+                await self.ws.close(CLOSE_PING_TIMEOUT, "ping timeout")
+                return
+            await self.send("ping")
+
+    async def _turn(self, n: int, req: ChatReq) -> bool:
+        try:
+            ticket = await ADMISSION_CONTROL.admit(self.sid, self.client)
+        except HTTPException as e:
+            await self.send("error", turn=n, status=e.status_code, detail=e.detail,
+                            retry_after=(e.headers or {}).get("Retry-After"))
+            return False
+        started = time.perf_counter()
+        turn = None
+        ok = False
+        try:
+            async with ticket:
+                turn = await prepare_turn(req)
+                ok = await self._generate(n, turn)
+                return ok
+        except WebSocketDisconnect:
+            raise
+        except HTTPException as e:
+            await self.send("error", turn=n, status=e.status_code, detail=e.detail)
+            return False
+        except Exception as e:
+            LLM_ERRORS.child(model_label(req.model or ""), "stream").inc()
+            await self.send("error", turn=n, status=500, detail=f"AI error: {e}")
+            return False
+        finally:
+            if turn is not None:
+                ROUTER.record(turn.route, req.message, turn.context_chars, time.perf_counter() - started, ok)
+
+    async def _generate(self, n: int, turn) -> bool:
+        # unshared: this connection reads the upstream stream itself
+        events, served, cache = await open_turn(turn, share=False)
+        start = {"model": served.model, "path": served.path} if served else {"model": turn.req.model}
+        if cache:
+            start["cache"] = cache
+        try:
+            await self.send("start", turn=n, tier=turn.route.tier, **start)
+            async for kind, data in events:
+                if kind == "delta":
+                    await self.send("delta", turn=n, delta=data)
+                elif kind == "error":
+                    await self.send("error", turn=n, status=500, detail=data)
+                    return False
+                else:
+                    await self.send(kind, turn=n)
+        finally:
+            await events.aclose()
+        return True
+
+
+@router.websocket("/ws/chat")
+async def ws_chat(ws: WebSocket, session_id: str):
+    await ws.accept()
+    if WS_CONNECTIONS.value >= WS_MAX_CONNECTIONS:
+        await ws.close(CLOSE_TRY_AGAIN, "Too many connections")
+        return
+    WS_CONNECTIONS.inc()
+    conn = Connection(ws, session_id)
+    try:
+        await conn.send("ready", session_id=session_id)
+        await conn.run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        WS_CONNECTIONS.dec()
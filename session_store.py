@@ -0,0 +1,158 @@
+import os, json, time, sqlite3, asyncio, threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict
+
+from lru import LRUCache
+
+# A session is a JSON-serializable dict; "messages" holds the turn history
+# and "summary" the condensed text of turns dropped from it.
+Session = Dict[str, Any]
+
+SESSION_STORE       = os.getenv("SESSION_STORE", "memory")      # memory | sqlite
+SESSION_TTL         = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MAX_BYTES   = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_DB_PATH     = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+
+def new_session() -> Session:
+    return {"messages": []}
+
+def session_size(session: Session) -> int:
+    # cheap estimate; avoids re-serializing the whole session on every save
+    size = 64 + len(session.get("summary") or "")
+    return size + sum(len(m.get("content", "")) + 48 for m in session.get("messages", ()))
+
+
+class SessionStore(ABC):
+    """Keyed by session_id. load() never fails for unknown ids: it returns a
+    fresh session. Callers mutate the returned dict and save() it back."""
+
+    @abstractmethod
+    async def load(self, sid: str) -> Session: ...
+
+    @abstractmethod
+    async def save(self, sid: str, session: Session) -> None: ...
+
+    @abstractmethod
+    async def delete(self, sid: str) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]: ...
+
+    async def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU with TTL, entry cap and a byte budget."""
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, max_bytes: int = SESSION_MAX_BYTES,
+                 ttl: float = SESSION_TTL):
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, sizeof=session_size)
+
+    async def load(self, sid: str) -> Session:
+        session = self._cache.get(sid)
+        return session if session is not None else new_session()
+
+    async def save(self, sid: str, session: Session) -> None:
+        self._cache.set(sid, session)
+
+    async def delete(self, sid: str) -> None:
+        self._cache.pop(sid)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SQLiteSessionStore(SessionStore):
+    """One row per session in a WAL-mode SQLite file, so several uvicorn
+    workers on the same host can share sessions."""
+
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_entries: int = SESSION_MAX_ENTRIES,
+                 ttl: float = SESSION_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " sid TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated)")
+
+    async def load(self, sid: str) -> Session:
+        row = await asyncio.to_thread(self._query, "SELECT data, updated FROM sessions WHERE sid = ?", (sid,))
+        if not row or (self.ttl and row[1] < time.time() - self.ttl):
+            return new_session()
+        return json.loads(row[0])
+
+    async def save(self, sid: str, session: Session) -> None:
+        data = json.dumps(session, ensure_ascii=False)
+        await asyncio.to_thread(self._save, sid, data)
+
+    async def delete(self, sid: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._query("SELECT COUNT(*) FROM sessions", ())[0]
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    async def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql: str, params: tuple):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._db.execute(sql, params).rowcount
+
+    def _save(self, sid: str, data: str) -> None:
+        self._execute(
+            "INSERT INTO sessions (sid, data, updated) VALUES (?, ?, ?)"
+            " ON CONFLICT(sid) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+            (sid, data, time.time()),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge()
+
+    def _purge(self) -> None:
+        if self.ttl:
+            self.expirations += self._execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            self.evictions += self._execute(
+                "DELETE FROM sessions WHERE sid IN ("
+                " SELECT sid FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+def create_store() -> SessionStore:
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    if SESSION_STORE == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE}")
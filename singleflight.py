@@ -0,0 +1,140 @@
+import os, json, asyncio, hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from metrics import LLM_COALESCED
+
+# Identical upstream requests that overlap in time share one call. Plain
+# calls share a future; streams share a Broadcast that buffers every event
+# so late joiners replay the prefix and then follow the live stream.
+SINGLEFLIGHT = os.getenv("SINGLEFLIGHT", "1").lower() in ("1", "true", "yes")
+
+
+def request_key(*parts: Any) -> Optional[str]:
+    """Exact-match key for an upstream request, or None when coalescing is off."""
+    if not SINGLEFLIGHT:
+        return None
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class Broadcast:
+    """Fan-out of one async event source to any number of subscribers.
+
+    The source is opened and drained by its own task, so it does not depend
+    on any one subscriber staying connected. When the last subscriber leaves
+    before the end, the task is cancelled and the source closed.
+    """
+
+    def __init__(self, open_source: Callable[[], Awaitable[AsyncIterator[Any]]],
+                 on_done: Callable[["Broadcast"], None]):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(open_source))
+
+    async def _pump(self, open_source) -> None:
+        source = None
+        try:
+            source = await open_source()
+            self.ready.set_result(None)
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            if not self.ready.done():
+                self.ready.cancel()
+        except Exception as e:
+            if not self.ready.done():
+                self.ready.set_exception(e)
+                self.ready.exception()  # retrieved by the subscribers, if any
+            else:
+                self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self._on_done(self)
+            if source is not None:
+                await source.aclose()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        i = 0
+        try:
+            while True:
+                changed = self._changed
+                while i < len(self.events):
+                    yield self.events[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.leave()
+
+    def leave(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers <= 0 and not self.done:
+            self._task.cancel()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, Broadcast] = {}
+
+    async def do(self, key: Optional[str], kind: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn(), or the identical call already in flight under `key`."""
+        if key is None:
+            return await fn()
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = self._calls[key] = asyncio.ensure_future(fn())
+            fut.add_done_callback(lambda f: self._finish_call(key, f))
+        else:
+            LLM_COALESCED.child(kind).inc()
+        # a cancelled caller must not cancel the call for everyone else
+        return await asyncio.shield(fut)
+
+    def _finish_call(self, key: str, fut: asyncio.Future) -> None:
+        if self._calls.get(key) is fut:
+            del self._calls[key]
+        if not fut.cancelled():
+            fut.exception()
+
+    async def stream(self, key: Optional[str], kind: str,
+                     open_source: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+        """Subscribe to the stream opened by open_source(), sharing it with
+        identical in-flight requests. Errors from opening it are raised here."""
+        b = self._streams.get(key) if key is not None else None
+        if b is None:
+            b = Broadcast(open_source, lambda done: self._finish_stream(key, done))
+            if key is not None:
+                self._streams[key] = b
+        else:
+            LLM_COALESCED.child(kind).inc()
+        b.subscribers += 1
+        try:
+            await asyncio.shield(b.ready)
+        except BaseException:
+            b.leave()
+            raise
+        return b.subscribe()
+
+    def _finish_stream(self, key: Optional[str], b: Broadcast) -> None:
+        if key is not None and self._streams.get(key) is b:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls_in_flight": len(self._calls), "streams_in_flight": len(self._streams)}
+
+
+FLIGHTS = SingleFlight()
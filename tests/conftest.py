@@ -0,0 +1,36 @@
+import os, sys, json, time
+
+os.environ.update(OPENAI_API_KEY="test", LLM_CACHE="1", ADMISSION="0", LLM_HEDGE="0", LLM_RETRIES="0",
+                  RESPONSE_CHAINING="0", SESSION_STORE="memory", LLM_CACHE_PATH="")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+
+def response_obj(text: str, model: str = "gpt-4o", rid: str = "resp_1") -> dict:
+    return {"id": rid, "object": "response", "created_at": int(time.time()), "model": model,
+            "status": "completed", "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+            "output": [{"type": "message", "id": "msg_1", "role": "assistant", "status": "completed",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+            "usage": {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15,
+                      "input_tokens_details": {"cached_tokens": 0},
+                      "output_tokens_details": {"reasoning_tokens": 0}}}
+
+
+@pytest.fixture
+def upstream():
+    """Points the OpenAI client at a mock answering every /responses call;
+    yields the list of request bodies it received."""
+    import llm
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content or b"{}"))
+        return httpx.Response(200, json=response_obj("Hello there, traveller!"))
+
+    saved = llm._client
+    llm._client = AsyncOpenAI(api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    yield calls
+    llm._client = saved
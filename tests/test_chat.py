@@ -0,0 +1,17 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_chat_cache_hit(upstream):
+    with TestClient(main.app) as client:
+        first = client.post("/chat", json={"session_id": "cache-a", "message": "Best time to visit Lisbon?"})
+        assert first.status_code == 200
+        assert first.headers["X-Cache"] == "MISS"
+
+        # same context from another session: answered from the cache
+        second = client.post("/chat", json={"session_id": "cache-b", "message": "Best time to visit Lisbon?"})
+        assert second.status_code == 200
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.text == first.text
+    assert len(upstream) == 1
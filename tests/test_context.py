@@ -0,0 +1,30 @@
+import pytest
+
+import context
+from context import build_context, count_tokens, MESSAGE_OVERHEAD
+
+
+def _session(n: int, tokens: int = 1000) -> dict:
+    return {"messages": [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}", "tokens": tokens}
+                         for i in range(n)]}
+
+
+def _sent(monkeypatch, n: int, budget: int) -> list:
+    # budget is what is left for history once the new message is counted
+    monkeypatch.setattr(context, "CONTEXT_WINDOW_STEP", 8)
+    monkeypatch.setitem(context.CONTEXT_BUDGETS, "gpt-4o", budget + count_tokens("next", "gpt-4o") + MESSAGE_OVERHEAD)
+    out = build_context(_session(n), "next", "gpt-4o")
+    assert out[-1] == {"role": "user", "content": "next"}
+    return [m["content"] for m in out[:-1]]
+
+
+@pytest.mark.parametrize("budget, expected", [(3500, 3), (9500, 9)])
+def test_window_smaller_than_a_step_is_not_rounded(monkeypatch, budget, expected):
+    sent = _sent(monkeypatch, 20, budget)
+    assert sent == [f"m{i}" for i in range(20 - expected, 20)]
+
+
+def test_window_rounded_to_step(monkeypatch):
+    # 17 fit; dropping to a multiple of 8 still sends 16
+    sent = _sent(monkeypatch, 40, 17500)
+    assert sent == [f"m{i}" for i in range(24, 40)]
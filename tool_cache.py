@@ -0,0 +1,70 @@
+import os, hashlib
+from typing import Any, Callable, Dict, Hashable, Mapping, NamedTuple, Type
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from lru import LRUCache
+from serialization import render
+
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "4096"))
+TOOL_CACHE_MAX_BYTES   = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+ENTRY_OVERHEAD = 200  # key, etag and bookkeeping per entry, roughly
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Serialized JSON bodies for pure endpoints, keyed on (route, request)."""
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES, max_bytes: int = TOOL_CACHE_MAX_BYTES):
+        self._lru = LRUCache(max_entries=max_entries, max_bytes=max_bytes,
+                             sizeof=lambda e: len(e.body) + ENTRY_OVERHEAD)
+
+    def get(self, route: str, req: BaseModel, response: Type[BaseModel],
+            build: Callable[[BaseModel], Mapping[str, Any]]) -> CachedResponse:
+        # validated request models are already whitespace-stripped, so their
+        # JSON form is the normalized key
+        key: Hashable = (route, req.model_dump_json())
+        entry = self._lru.get(key)
+        if entry is None:
+            body = render(response, build(req))
+            entry = CachedResponse(body, etag_for(body))
+            self._lru.set(key, entry)
+        return entry
+
+    def respond(self, request: Request, route: str, req: BaseModel, response: Type[BaseModel],
+                build: Callable[[BaseModel], Mapping[str, Any]]) -> Response:
+        entry = self.get(route, req, response, build)
+        inm = request.headers.get("if-none-match")
+        if inm and etag_matches(inm, entry.etag):
+            return Response(status_code=304, headers={"ETag": entry.etag})
+        return Response(entry.body, media_type="application/json", headers={"ETag": entry.etag})
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._lru.stats()
+
+
+TOOL_CACHE = ResponseCache()
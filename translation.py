@@ -0,0 +1,151 @@
+import os, json, time, asyncio, logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from llm import get_client, limiter
+from lru import LRUCache
+from metrics import LLM_ERRORS, model_label, record_usage
+
+log = logging.getLogger(__name__)
+
+# Translation memory in front of the model: phrases are cached per
+# (normalized phrase, language), and misses arriving within
+# TRANSLATION_BATCH_MS of each other go upstream as one request.
+TRANSLATION_MODEL       = os.getenv("TRANSLATION_MODEL", "gpt-4o-mini")
+TRANSLATION_BATCH_MS    = float(os.getenv("TRANSLATION_BATCH_MS", "15"))
+TRANSLATION_MAX_BATCH   = int(os.getenv("TRANSLATION_MAX_BATCH", "32"))
+TRANSLATION_MAX_ENTRIES = int(os.getenv("TRANSLATION_MAX_ENTRIES", "20000"))
+TRANSLATION_WARM_FILE   = os.getenv("TRANSLATION_WARM_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "phrases.json"))
+
+INSTRUCTIONS = (
+    "Translate each item's text into its target language for a traveller. "
+    'Reply with a JSON object {"translations": [...]} holding one string per item, in the same order. '
+    "Return only the translation, with no notes or transliteration."
+)
+
+LANGUAGE_CODES = {
+    "en": "english", "es": "spanish", "fr": "french", "de": "german", "it": "italian",
+    "pt": "portuguese", "ja": "japanese", "zh": "chinese", "ko": "korean", "tr": "turkish",
+    "ar": "arabic", "ru": "russian", "nl": "dutch", "el": "greek", "th": "thai",
+}
+
+Key = Tuple[str, str]
+
+
+def normalize_phrase(phrase: str) -> str:
+    return " ".join(phrase.replace("’", "'").split()).strip("?!.¿¡ ").casefold()
+
+def normalize_language(language: str) -> str:
+    lang = " ".join(language.split()).casefold()
+    return LANGUAGE_CODES.get(lang, lang)
+
+def memory_key(phrase: str, language: str) -> Key:
+    return normalize_phrase(phrase), normalize_language(language)
+
+
+class TranslationError(Exception):
+    pass
+
+
+class Translator:
+    """Translation memory plus a micro-batcher for its misses. Identical
+    phrases waiting for the same batch share one slot in it."""
+
+    def __init__(self, model: str = TRANSLATION_MODEL, window: float = TRANSLATION_BATCH_MS / 1000,
+                 max_batch: int = TRANSLATION_MAX_BATCH, max_entries: int = TRANSLATION_MAX_ENTRIES):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.memory = LRUCache(max_entries=max_entries)
+        self.batches = 0
+        self.batched_phrases = 0
+        self._pending: Dict[Key, asyncio.Future] = {}
+        self._queue: List[Tuple[Key, str, str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def warm(self, path: str) -> int:
+        """Preload {language: {phrase: translation}} from a JSON file."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("translation warm file %s not loaded: %s", path, e)
+            return 0
+        n = 0
+        for language, phrases in data.items():
+            for phrase, text in phrases.items():
+                self.memory.set(memory_key(phrase, language), text, 1)
+                n += 1
+        return n
+
+    async def translate(self, phrase: str, language: str) -> str:
+        key = memory_key(phrase, language)
+        text = self.memory.get(key)
+        if text is not None:
+            return text
+        fut = self._pending.get(key)
+        if fut is None:
+            fut = self._pending[key] = asyncio.get_running_loop().create_future()
+            self._queue.append((key, phrase, language))
+            if len(self._queue) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(fut)
+
+    async def translate_many(self, phrases: List[str], language: str) -> List[str]:
+        return list(await asyncio.gather(*(self.translate(p, language) for p in phrases)))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Key, str, str]]) -> None:
+        self.batches += 1
+        self.batched_phrases += len(batch)
+        try:
+            texts = await self._upstream([(phrase, language) for _, phrase, language in batch])
+        except Exception as e:
+            LLM_ERRORS.child(model_label(self.model), "translation").inc()
+            err = e if isinstance(e, TranslationError) else TranslationError(str(e))
+            for key, _, _ in batch:
+                fut = self._pending.pop(key)
+                fut.set_exception(err)
+                fut.exception()  # waiters may have gone away
+            return
+        for (key, _, _), text in zip(batch, texts):
+            self.memory.set(key, text, 1)
+            self._pending.pop(key).set_result(text)
+
+    async def _upstream(self, items: List[Tuple[str, str]]) -> List[str]:
+        payload = [{"text": phrase, "target_language": language} for phrase, language in items]
+        async with limiter:
+            started = time.perf_counter()
+            rsp = await get_client().responses.create(
+                model=self.model,
+                instructions=INSTRUCTIONS,
+                input=json.dumps({"items": payload}, ensure_ascii=False),
+                text={"format": {"type": "json_object"}},
+            )
+        record_usage(self.model, "translation", started, rsp.usage)
+        try:
+            texts = json.loads(rsp.output_text)["translations"]
+        except (ValueError, KeyError, TypeError):
+            raise TranslationError("Malformed translation reply")
+        if not isinstance(texts, list) or len(texts) != len(items) or not all(isinstance(t, str) for t in texts):
+            raise TranslationError("Translation reply does not match the request")
+        return [t.strip() for t in texts]
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.memory.stats(), "batches": self.batches, "batched_phrases": self.batched_phrases,
+                "pending": len(self._pending)}
+
+
+TRANSLATOR = Translator()
+TRANSLATOR.warm(TRANSLATION_WARM_FILE)